@@ -1,6 +1,8 @@
+import atexit
 from io import open
 import os
 import shutil
+import sqlite3
 from sqlite3 import Error
 from tempfile import mkdtemp
 from unittest import TestCase
@@ -36,6 +38,29 @@ page_tag_table = "CREATE TABLE IF NOT EXISTS page_tag (" \
                  "FOREIGN KEY(page_id) REFERENCES pages(id)," \
                  "FOREIGN KEY(tag_id) REFERENCES tags(name));"
 
+#: content directory holding the default ``config.py``, built once and copied
+#: into each test's root directory
+_TEMPLATE_DIR = mkdtemp()
+with open(os.path.join(_TEMPLATE_DIR, 'config.py'), 'w', encoding='utf-8') as _fhd:
+    _fhd.write(CONFIGURATION)
+atexit.register(shutil.rmtree, _TEMPLATE_DIR, True)
+
+#: in-memory database holding the empty schema, copied into the test database
+#: with the backup API instead of running the table definitions every time
+_template_database = None
+
+
+def get_template_database():
+    """
+        Returns the in-memory schema template, built on first use.
+    """
+    global _template_database
+    if _template_database is None:
+        _template_database = sqlite3.connect(":memory:")
+        _template_database.executescript(
+            "\n".join((page_table, tag_table, page_tag_table)))
+    return _template_database
+
 
 class WikiBaseTestCase(TestCase):
 
@@ -50,7 +75,10 @@ class WikiBaseTestCase(TestCase):
         self._wiki = None
         self._app = None
         self.rootdir = mkdtemp()
-        self.create_file(u'config.py', self.config_content)
+        if self.config_content == CONFIGURATION:
+            shutil.copytree(_TEMPLATE_DIR, self.rootdir, dirs_exist_ok=True)
+        else:
+            self.create_file(u'config.py', self.config_content)
 
     @property
     def wiki(self):
@@ -92,22 +120,34 @@ class WikiBaseTestCase(TestCase):
 
     def tearDown(self):
         """
-            Will remove the root directory and all contents if one
-            exists.
+            Will close the index database and remove the root
+            directory and all contents if one exists.
         """
+        # the connection to the index database is shared by the process
+        # and would keep its file open
+        Wiki(self.rootdir).close_index_db()
         if self.rootdir and os.path.exists(self.rootdir):
             shutil.rmtree(self.rootdir)
 
     @staticmethod
     def create_test_database():
         """
-        Create a test database modeled after wiki database to perform operation on for testing
+        Create a test database modeled after wiki database to perform operation on for testing, in a new
+        temporary directory so the tests never write into the source tree
+        :return: the Database object of the test database
         """
-        # create new Database object that connects to test database
-        testDB = Database("testDB")
+        # create new Database object that connects to test database and copy the empty schema into it
+        testDB = Database("testDB", mkdtemp())
         try:
-            testDB.create_table(page_table)
-            testDB.create_table(tag_table)
-            testDB.create_table(page_tag_table)
+            get_template_database().backup(testDB.conn)
         except Error as e:
             print(e)
+        return testDB
+
+    @staticmethod
+    def remove_test_database(testDB):
+        """
+        Close the test database and remove its temporary directory
+        """
+        testDB.close_connection()
+        shutil.rmtree(os.path.dirname(testDB.path), True)
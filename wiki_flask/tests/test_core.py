@@ -8,6 +8,8 @@ from wiki.core import clean_url
 from wiki.core import wikilink
 from wiki.core import Page
 from wiki.core import Processor
+from wiki.core import Wiki
+from wiki.Database import Database
 
 from . import WikiBaseTestCase
 
@@ -208,6 +210,30 @@ class PageTestCase(WikiBaseTestCase):
         assert saved == self.page_content
 
 
+    def test_page_saving_new_version(self):
+        """
+            Assert that saving a page returns it as the new version.
+        """
+        saved = self.page.save()
+        assert saved is self.page
+        assert saved.path == self.page_path[:-len('.md')] + '_v1.md'
+        assert saved.url == 'test_v1'
+        assert saved.title == u'Test'
+
+    def test_page_saving_new_folder(self):
+        """
+            Assert that a page can be saved into a folder that does not
+            exist yet.
+        """
+        page = self.wiki.get_bare('newdir/page')
+        page.title = u'New'
+        page.body = u'Hello\n'
+        saved = page.save()
+        assert saved.path == os.path.join(self.rootdir, 'newdir', 'page_v1.md')
+        assert saved.url == 'newdir/page_v1'
+        assert os.path.exists(saved.path)
+
+
 class WikiTestCase(WikiBaseTestCase):
     """
         Contains various tests for the :class:`~wiki.core.Wiki`
@@ -263,3 +289,157 @@ class WikiTestCase(WikiBaseTestCase):
 
         testpage = pages[1]
         assert testpage.url == 'test'
+
+    def test_index_cache(self):
+        """
+            Assert unchanged pages are listed from the index without
+            being rendered and changed pages are rendered again.
+        """
+        path = self.create_file('test.md', PAGE_CONTENT)
+        self.wiki.index()
+        # drop the pages kept in memory so they come from the database
+        Wiki._page_cache.clear()
+        with patch.object(Page, 'render') as render:
+            pages = self.wiki.index()
+        assert not render.called
+        assert pages[0].title == 'Test'
+        assert pages[0].tags == 'one, two, 3, jö'
+
+        with open(path, 'a', encoding='utf-8') as fhd:
+            fhd.write(u'\nMore text.\n')
+        pages = self.wiki.index()
+        assert 'More text.' in pages[0].body
+
+    def test_wikilinks_follow_request(self):
+        """
+            Assert the wikilinks of a page are built for the request
+            showing it, not for the first one that rendered it.
+        """
+        path = self.create_file('test.md', u'title: Test\n\n[[Other Page]]\n')
+        app = self.app.application
+        with app.test_request_context(base_url='http://x/'):
+            assert "href='/other_page/'" in Page(path, 'test').html
+        with app.test_request_context(base_url='http://x/wiki/'):
+            assert "href='/wiki/other_page/'" in Page(path, 'test').html
+
+    def test_index_db_schema(self):
+        """
+            Assert the tables of the index database are only created
+            by the first wiki of the content directory.
+        """
+        self.create_file('test.md', PAGE_CONTENT)
+        self.wiki.index()
+        with patch.object(Database, 'create_tables') as create_tables:
+            Wiki(self.rootdir).index()
+        assert not create_tables.called
+
+    def test_search(self):
+        """
+            Assert search finds plain text and regular expressions
+            and follows changes to the pages.
+        """
+        path = self.create_file('test.md', PAGE_CONTENT)
+        self.create_file('other.md', u'title: Other\n\nNothing here.\n')
+        assert [p.url for p in self.wiki.search('MAGNIFICENT')] == ['test']
+        assert self.wiki.search('MAGNIFICENT', ignore_case=False) == []
+        assert [p.url for p in self.wiki.search('Noth.ng')] == ['other']
+
+        with open(path, 'w', encoding='utf-8') as fhd:
+            fhd.write(u'title: Test\n\nRewritten.\n')
+        assert self.wiki.search('magnificent') == []
+        assert [p.url for p in self.wiki.search('rewritten')] == ['test']
+        # python folds case differently than the full text index
+        self.create_file('city.md', u'title: City\n\nİstanbul\n')
+        assert [p.url for p in self.wiki.search('istanbul')] == ['city']
+        assert [p.url for p in self.wiki.search('İSTANBUL')] == ['city']
+        # the url is not in the full text index
+        self.create_file('unlisted.md', u'title: Hidden\n\nNothing here.\n')
+        assert [p.url for p in self.wiki.search('unlisted', attrs=['url'])] == ['unlisted']
+
+    def test_index_by(self):
+        """
+            Assert index_by groups the pages on the given attribute.
+        """
+        self.create_file('test.md', PAGE_CONTENT)
+        self.create_file('other.md', PAGE_CONTENT)
+        index = self.wiki.index_by('title')
+        assert list(index) == ['Test']
+        assert sorted(page.url for page in index['Test']) == ['other', 'test']
+
+    def test_index_page_cache(self):
+        """
+            Assert index returns the same page objects until a file
+            changes.
+        """
+        path = self.create_file('test.md', PAGE_CONTENT)
+        first = self.wiki.index()[0]
+        assert self.wiki.index()[0] is first
+
+        with open(path, 'a', encoding='utf-8') as fhd:
+            fhd.write(u'\nMore text.\n')
+        assert self.wiki.index()[0] is not first
+
+    def test_get_tags(self):
+        """
+            Assert get_tags groups the pages on each of their tags.
+        """
+        self.create_file('test.md', PAGE_CONTENT)
+        self.create_file('other.md', u'title: Other\ntags: one\n\nText\n')
+        tags = self.wiki.get_tags()
+        assert sorted(tags) == ['3', 'jö', 'one', 'two']
+        assert [page.url for page in tags['one']] == ['other', 'test']
+        assert [page.url for page in tags['two']] == ['test']
+
+    def test_index_by_tag(self):
+        """
+            Assert index_by_tag only lists pages carrying the whole tag.
+        """
+        self.create_file('test.md', PAGE_CONTENT)
+        self.create_file('other.md', u'title: Other\ntags: ones\n\nText\n')
+        assert [page.url for page in self.wiki.index_by_tag('one')] == ['test']
+        assert self.wiki.index_by_tag('on') == []
+
+    def test_delete_many(self):
+        """
+            Assert deleting several URLs deletes their files.
+        """
+        self.create_file('test.md')
+        self.create_file('other.md')
+        assert self.wiki.delete_many(['test', 'other', 'missing']) == 2
+        assert not os.path.exists(os.path.join(self.rootdir, 'test.md'))
+        assert not os.path.exists(os.path.join(self.rootdir, 'other.md'))
+
+    def test_index_lookups(self):
+        """
+            Assert the index can be looked up by path and by file.
+        """
+        self.create_file('test_v1.md', PAGE_CONTENT)
+        path = self.create_file('test_v2.md', PAGE_CONTENT)
+        assert self.wiki.by_path[path].url == 'test_v2'
+        key = Page.get_version_key(path)[0]
+        assert self.wiki.by_base[key].path == path
+
+        self.wiki.delete('test_v2')
+        assert path not in self.wiki.by_path
+        assert self.wiki.by_base[key].url == 'test_v1'
+
+    def test_get_versions(self):
+        """
+            Assert all versions of a file are listed, but no other files.
+        """
+        first = self.create_file('test_v1.md', PAGE_CONTENT)
+        second = self.create_file('test_v2.md', PAGE_CONTENT)
+        self.create_file('test.md', PAGE_CONTENT)
+        self.create_file('other_v1.md', PAGE_CONTENT)
+        versions = self.wiki.get_versions(first)
+        assert sorted(page.path for page in versions) == [first, second]
+
+    def test_filter_old_versions(self):
+        """
+            Assert only the latest version of every file is kept.
+        """
+        self.create_file('test_v1.md', PAGE_CONTENT)
+        self.create_file('test_v2.md', PAGE_CONTENT)
+        self.create_file('other.md', PAGE_CONTENT)
+        pages = self.wiki.filter_old_versions(self.wiki.index())
+        assert sorted(page.url for page in pages) == ['other', 'test_v2']
@@ -1,3 +1,5 @@
+import os
+
 from core import Page
 from wiki.Database import Database
 
@@ -58,12 +60,21 @@ class DatabaseTestCase(WikiBaseTestCase):
     page_4 = None
     all_pages = []
 
-    # create test database using function in __init__.py
-    WikiBaseTestCase.create_test_database()
-    testDB = Database("testDB")
+    testDB = None
+    c = None
+
+    @classmethod
+    def setUpClass(cls):
+        # create test database using function in __init__.py, once for the whole class
+        cls.testDB = WikiBaseTestCase.create_test_database()
 
-    # create cursor object to execute sql statements on database
-    c = testDB.conn.cursor()
+        # create cursor object to execute sql statements on database
+        cls.c = cls.testDB.conn.cursor()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.c.close()
+        WikiBaseTestCase.remove_test_database(cls.testDB)
 
     def setUp(self):
         # setup wiki content directory and config file
@@ -80,10 +91,7 @@ class DatabaseTestCase(WikiBaseTestCase):
         self.page_2 = Page(page_path_2, URL_2)
         self.page_3 = Page(page_path_3, URL_3)
         self.page_4 = Page(page_path_4, URL_4)
-        self.all_pages.append(self.page_1)
-        self.all_pages.append(self.page_2)
-        self.all_pages.append(self.page_3)
-        self.all_pages.append(self.page_4)
+        self.all_pages = [self.page_1, self.page_2, self.page_3, self.page_4]
 
     def test_database_operations(self):
         """
@@ -91,6 +99,7 @@ class DatabaseTestCase(WikiBaseTestCase):
         """
         # Test database creation
         self.assertIsNot(self.testDB.conn,None)
+        self.assertTrue(self.isSQLite3(self.testDB.path))
 
         # Test table manipulation
         self.testDB.create_table("CREATE TABLE IF NOT EXISTS test_table ("
@@ -105,6 +114,21 @@ class DatabaseTestCase(WikiBaseTestCase):
         new_table = self.c.fetchone()
         self.assertEquals(new_table, None)
 
+    @staticmethod
+    def isSQLite3(filename):
+        """
+        Check that a file exists and starts with the SQLite 3 header, using a single stat call
+        """
+        try:
+            st = os.stat(filename)
+        except OSError:
+            return False
+        # every SQLite 3 database starts with a 100 byte header
+        if st.st_size < 100:
+            return False
+        with open(filename, 'rb') as fd:
+            return fd.read(16) == b'SQLite format 3\x00'
+
     def get_table_size(self, table_name):
         self.c.execute("SELECT COUNT (*) FROM %s" % table_name)
         table_size = self.c.fetchone()[0]
@@ -115,47 +139,34 @@ class DatabaseTestCase(WikiBaseTestCase):
         Test insertion of elements into page and tags table then test function to populate junction table
         """
 
-        # reset the tables for new test entries
-        init_page_rows = self.get_table_size("pages")
-        init_tags_rows = self.get_table_size("tags")
-        init_page_tag_rows = self.get_table_size("page_tag")
-        if init_page_rows > 0:
-            self.testDB.delete_row("pages")
-            self.testDB.delete_row("sqlite_sequence", "name = 'pages'")
-        if init_tags_rows > 0:
-            self.testDB.delete_row("tags")
-            self.testDB.delete_row("sqlite_sequence", "name = 'tags'")
-        if init_page_tag_rows > 0:
-            self.testDB.delete_row("page_tag")
-
-    # test the insert function for the page table
-        self.testDB.insert_page(self.page_1.url, self.page_1.title, self.page_1.body)
-        self.testDB.insert_page(self.page_2.url, self.page_2.title, self.page_2.body)
-        self.testDB.insert_page(self.page_3.url, self.page_3.title, self.page_3.body)
-        self.testDB.insert_page(self.page_4.url, self.page_4.title, self.page_4.body)
-        self.c.execute("SELECT COUNT (*) FROM pages")
-        num_rows = self.c.fetchone()[0]
-        self.assertEquals(num_rows, 4)
-
-        # test the insert function for the tags table
-        for page in self.all_pages:
-            tags_list = [x.strip() for x in page.tags.split(',')]
-            for tag in tags_list:
-                self.testDB.insert_tag(tag)
-        self.c.execute("SELECT COUNT (*) FROM tags")
-        num_rows = self.c.fetchone()[0]
-        self.assertEquals(num_rows, 9)
-
-        # test the insert function for the page_tag junction table, inserts one entry for each tag on a page
-        for page in self.all_pages:
-            self.c.execute("SELECT id FROM pages WHERE name = ? AND title = ?;", (page.url, page.title))
-            page_id = self.c.fetchone()[0]
-            tags_list = [x.strip() for x in page.tags.split(',')]
-            for tag in tags_list:
-                self.testDB.insert_page_tag(page_id, tag)
-        self.c.execute("SELECT COUNT (*) FROM page_tag")
-        num_rows = self.c.fetchone()[0]
-        self.assertEquals(num_rows, 11)
+        # reset the tables for new test entries, the junction table is cleared first so no foreign keys
+        # point at deleted rows
+        self.testDB.reset_tables(["page_tag", "pages", "tags"])
+
+        with self.testDB.bulk():
+            # test the insert function for the page table
+            self.testDB.insert_pages([(page.url, page.title, page.body) for page in self.all_pages])
+            self.c.execute("SELECT COUNT (*) FROM pages")
+            num_rows = self.c.fetchone()[0]
+            self.assertEquals(num_rows, 4)
+
+            # test the insert function for the tags table
+            tags_list = []
+            for page in self.all_pages:
+                tags_list.extend(page.tag_list)
+            self.testDB.insert_tags(tags_list)
+            self.c.execute("SELECT COUNT (*) FROM tags")
+            num_rows = self.c.fetchone()[0]
+            self.assertEquals(num_rows, 9)
+
+            # test the insert function for the page_tag junction table, inserts one entry for each tag on a page
+            page_tags = []
+            for page in self.all_pages:
+                page_tags.extend([(page.url, page.title, tag) for tag in page.tag_list])
+            self.testDB.link_page_tags(page_tags)
+            self.c.execute("SELECT COUNT (*) FROM page_tag")
+            num_rows = self.c.fetchone()[0]
+            self.assertEquals(num_rows, 11)
 
     def test_table_read_operations(self):
         """
@@ -172,6 +183,11 @@ class DatabaseTestCase(WikiBaseTestCase):
             print(row)
         self.assertEquals(len(selected_list), 3)
 
+        # testing select with bound search values
+        selected_list = self.testDB.find_rows("name, title", "pages", False, {"title": "Test2"})
+        self.assertEquals(selected_list, [("page2", "Test2")])
+        self.assertRaises(ValueError, self.testDB.find_rows, "*", "sqlite_master", False)
+
     def test_table_manipulation_operations(self):
         """
         Test update and delete operations on the table
@@ -186,4 +202,71 @@ class DatabaseTestCase(WikiBaseTestCase):
         # testing update functionality
         self.c.execute("SELECT COUNT (*) FROM pages WHERE name = 'updated_name'")
         pages_updated = self.c.fetchone()[0]
-        self.assertEquals(pages_updated, 1)
\ No newline at end of file
+        self.assertEquals(pages_updated, 1)
+    def test_memory_databases(self):
+        """
+        Test that every in-memory database is independent of the others
+        """
+        first = Database(":memory:")
+        second = Database(":memory:")
+        try:
+            self.assertIsNot(first.conn, second.conn)
+            first.create_table("CREATE TABLE IF NOT EXISTS test_table (id INTEGER PRIMARY KEY);")
+            self.assertEquals(second.conn.execute(
+                "SELECT name FROM sqlite_master WHERE name='test_table'").fetchone(), None)
+        finally:
+            first.close_connection()
+            second.close_connection()
+
+    def test_shared_connection(self):
+        """
+        Test that a connection shared by several Database objects stays open until all of them closed it
+        """
+        first = Database("testDB", os.path.dirname(self.testDB.path))
+        second = Database("testDB", os.path.dirname(self.testDB.path))
+        self.assertIs(first.conn, self.testDB.conn)
+        first.close_connection()
+        first.close_connection()
+        second.close_connection()
+        self.assertEquals(self.testDB.find_rows("name", "tags", False, {"name": "missing"}), [])
+
+    def test_bulk_insert_json(self):
+        """
+        Test inserting rows passed as a single JSON array and the validation of table and column names
+        """
+        self.testDB.reset_tables(["page_tag", "pages", "tags"])
+        self.testDB.bulk_insert_json("pages", ["name", "title", "body"],
+                                     [{"name": page.url, "title": page.title, "body": page.body}
+                                      for page in self.all_pages])
+        self.assertEquals(self.testDB.find_rows("name, title, body", "pages", False, order_by="id"),
+                          [(page.url, page.title, page.body) for page in self.all_pages])
+
+        self.assertRaises(ValueError, self.testDB.bulk_insert_json, "sqlite_master", ["name"], [])
+        self.assertRaises(ValueError, self.testDB.bulk_insert_json, "pages", ["name) VALUES (1"], [])
+        self.testDB.reset_tables(["page_tag", "pages", "tags"])
+
+    def test_bulk_load_page_tags(self):
+        """
+        Test loading junction table entries through the staging table, duplicates are loaded once and the
+        staging table is dropped afterwards, also when loading fails
+        """
+        self.testDB.reset_tables(["page_tag", "pages", "tags"])
+        self.testDB.insert_pages([(page.url, page.title, page.body) for page in self.all_pages])
+        self.testDB.insert_tags(["one", "two"])
+        self.testDB.bulk_load_page_tags([(1, "one"), (1, "one"), (2, "one"), (1, "two"), (2, "one")])
+        self.assertEquals(sorted(self.testDB.find_rows("page_id, tag_id", "page_tag", False)),
+                          [(1, "one"), (1, "two"), (2, "one")])
+        self.assertEquals(self.get_staging_tables(), [])
+
+        def failing_pairs():
+            yield (3, "one")
+            raise RuntimeError("loading failed")
+
+        self.assertRaises(RuntimeError, self.testDB.bulk_load_page_tags, failing_pairs())
+        self.assertEquals(self.get_table_size("page_tag"), 3)
+        self.assertEquals(self.get_staging_tables(), [])
+        self.testDB.reset_tables(["page_tag", "pages", "tags"])
+
+    def get_staging_tables(self):
+        self.c.execute("SELECT name FROM sqlite_temp_master WHERE name = 'page_tag_load'")
+        return self.c.fetchall()
@@ -141,3 +141,29 @@ class PageTestCase(WikiBaseTestCase):
         assert self.page_3 not in pages_4
         assert self.page_4 in pages_4
 
+
+    def test_iter_versions(self):
+        """
+            Assert that the versions of a path can be iterated lazily
+        """
+        pages = [self.page_1, self.page_2, self.page_3, self.page_4]
+        versions = Page.iter_versions(self.page_2.path, pages)
+        assert not isinstance(versions, list)
+        assert list(versions) == [self.page_2, self.page_3]
+
+    def test_highest_version_with_several_digits(self):
+        """
+            Assert that versions are compared on their whole number
+        """
+        self.create_file("test_v9.md", PAGE_CONTENT_2)
+        page_path_10 = self.create_file("test_v10.md", PAGE_CONTENT_2)
+        assert Page.get_highest_version_of_file_path(self.page_2.path) == page_path_10
+
+    def test_highest_page_from_unversioned_file(self):
+        """
+            Assert the highest version of a name is found in the pages.
+        """
+        pages = [self.page_1, self.page_2, self.page_3, self.page_4]
+        assert Page.get_highest_page_from_unversioned_file(pages, 'test') == self.page_3
+        assert Page.get_highest_page_from_unversioned_file(pages, 'name') == self.page_1
+        assert Page.get_highest_page_from_unversioned_file(pages, 'home') is None
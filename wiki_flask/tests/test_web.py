@@ -1,3 +1,12 @@
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
+
+from mock import patch
+
+from wiki.core import Wiki
+from wiki.web import routes
+
 from . import WikiBaseTestCase
 
 
@@ -14,3 +23,158 @@ class WebContentTestCase(WikiBaseTestCase):
         rsp = self.app.get('/')
         assert b"You did not create any content yet." in rsp.data
         assert rsp.status_code == 200
+
+    def test_display_not_modified(self):
+        """
+            Assert a page is answered with 304 Not Modified while it is
+            unchanged.
+        """
+        path = self.create_file('test.md', u'title: Test\n\nHello\n')
+        rsp = self.app.get('/test/')
+        assert rsp.status_code == 200
+        etag = rsp.headers['ETag']
+
+        rsp = self.app.get('/test/', headers={'If-None-Match': etag})
+        assert rsp.status_code == 304
+
+        with open(path, 'a') as fhd:
+            fhd.write(u'More\n')
+        rsp = self.app.get('/test/', headers={'If-None-Match': etag})
+        assert rsp.status_code == 200
+
+    def test_display_not_modified_since(self):
+        """
+            Assert a page is answered with 304 Not Modified to a client
+            sending the time it was last modified.
+        """
+        self.create_file('test.md', u'title: Test\n\nHello\n')
+        rsp = self.app.get('/test/')
+        assert rsp.status_code == 200
+        last_modified = rsp.headers['Last-Modified']
+
+        rsp = self.app.get('/test/',
+                           headers={'If-Modified-Since': last_modified})
+        assert rsp.status_code == 304
+
+    def test_index_not_modified(self):
+        """
+            Assert the index is answered with 304 Not Modified while no
+            page changed, every file is only looked at once.
+        """
+        self.create_file('test.md', u'title: Test\n\nHello\n')
+        path = self.create_file('other.md', u'title: Other\n\nBye\n')
+        rsp = self.app.get('/index/')
+        assert rsp.status_code == 200
+        etag = rsp.headers['ETag']
+
+        with patch('os.stat', wraps=os.stat) as stat:
+            rsp = self.app.get('/index/', headers={'If-None-Match': etag})
+        assert rsp.status_code == 304
+        assert sorted(call[0][0] for call in stat.call_args_list
+                      if call[0][0].endswith('.md')) == sorted(
+            [path, os.path.join(self.rootdir, 'test.md')])
+
+        with open(path, 'a') as fhd:
+            fhd.write(u'More\n')
+        rsp = self.app.get('/index/', headers={'If-None-Match': etag})
+        assert rsp.status_code == 200
+
+    def test_home_latest_version(self):
+        """
+            Assert the home page shows the latest version of the home
+            page.
+        """
+        self.create_file('home_v1.md', u'title: Home\n\nFirst version\n')
+        self.create_file('home_v2.md', u'title: Home\n\nSecond version\n')
+        rsp = self.app.get('/')
+        assert rsp.status_code == 200
+        assert b"Second version" in rsp.data
+
+    def test_display_view_cache(self):
+        """
+            Assert an unchanged page is only rendered once.
+        """
+        self.create_file('test.md', u'title: Test\n\nHello\n')
+        with patch.object(routes, 'render_template',
+                          wraps=routes.render_template) as render_template:
+            first = self.app.get('/test/')
+            second = self.app.get('/test/')
+        assert render_template.call_count == 1
+        assert first.data == second.data
+
+    def test_versions_not_modified(self):
+        """
+            Assert the versions of an unchanged page are answered with
+            304 Not Modified without indexing the wiki.
+        """
+        self.create_file('test_v1.md', u'title: Test\n\nHello\n')
+        self.create_file('test_v2.md', u'title: Test\n\nHello again\n')
+        rsp = self.app.get('/versions/test_v1/')
+        assert rsp.status_code == 200
+        assert b"test_v2" in rsp.data
+        etag = rsp.headers['ETag']
+
+        with patch.object(Wiki, 'index', autospec=True,
+                          side_effect=Wiki.index) as index:
+            rsp = self.app.get('/versions/test_v1/',
+                               headers={'If-None-Match': etag})
+        assert rsp.status_code == 304
+        assert index.call_count == 0
+
+        self.create_file('test_v3.md', u'title: Test\n\nOnce more\n')
+        rsp = self.app.get('/versions/test_v1/',
+                           headers={'If-None-Match': etag})
+        assert rsp.status_code == 200
+        assert b"test_v3" in rsp.data
+
+    def test_view_cache_script_root(self):
+        """
+            Assert a cached view is not shown under another script root,
+            its links would point to the wrong place.
+        """
+        self.create_file('test.md', u'title: Test\n\n[[Other Page]]\n')
+        rsp = self.app.get('/test/')
+        assert b"href='/other_page/'" in rsp.data
+        rsp = self.app.get('/test/', base_url='http://localhost/wiki/')
+        assert b"href='/wiki/other_page/'" in rsp.data
+
+    def test_view_cache_epoch(self):
+        """
+            Assert cached views are rendered again after pages were
+            changed through the wiki.
+        """
+        self.create_file('test.md', u'title: Test\n\nHello\n')
+        self.create_file('other.md', u'title: Other\n\nBye\n')
+        # deleting flashes a message, which needs the session
+        self.app.application.secret_key = 'test'
+        with patch.object(routes, 'render_template',
+                          wraps=routes.render_template) as render_template:
+            self.app.get('/test/')
+            self.app.get('/test/')
+            assert render_template.call_count == 1
+            rsp = self.app.get('/delete/other/')
+            assert rsp.status_code == 302
+            # shows the flashed message, which is never cached
+            self.app.get('/index/')
+            assert render_template.call_count == 2
+            self.app.get('/test/')
+        assert render_template.call_count == 3
+
+    def test_preview_workers(self):
+        """
+            Assert previews are rendered the same in the preview worker
+            processes.
+        """
+        # spawned workers do not inherit the flask context of the request
+        routes._preview_executor = ProcessPoolExecutor(
+            max_workers=1, mp_context=multiprocessing.get_context('spawn'))
+        with patch.dict('os.environ', {routes.PREVIEW_WORKERS_ENV: '1'}):
+            try:
+                rsp = self.app.post('/preview/', data={
+                    'body': u'title: Test\n\nHello *world* [[Other Page]]\n'})
+            finally:
+                routes._preview_executor.shutdown()
+                routes._preview_executor = None
+        assert rsp.status_code == 200
+        assert b"<em>world</em>" in rsp.data
+        assert b"<a href='/other_page/'>Other Page</a>" in rsp.data
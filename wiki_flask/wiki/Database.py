@@ -1,5 +1,11 @@
-import sqlite3, os
+import sqlite3, os, json
+from contextlib import contextmanager
+from functools import lru_cache, wraps
 from sqlite3 import Error
+from threading import Lock, RLock
+
+# directory the database files are stored in, resolved once at import
+_module_dir = os.path.dirname(os.path.realpath(__file__))
 
 # page table
 page_table = "CREATE TABLE IF NOT EXISTS pages (" \
@@ -20,17 +26,192 @@ page_tag_table = "CREATE TABLE IF NOT EXISTS page_tag (" \
                  "FOREIGN KEY(page_id) REFERENCES pages(id)," \
                  "FOREIGN KEY(tag_id) REFERENCES tags(name));"
 
+# cached metadata of the markdown files in a content directory, a row is reused by Wiki.index as long as
+# the file's modification time and size are unchanged
+page_index_table = "CREATE TABLE IF NOT EXISTS page_index (" \
+                   "path TEXT PRIMARY KEY NOT NULL," \
+                   "root TEXT NOT NULL," \
+                   "mtime INTEGER NOT NULL," \
+                   "size INTEGER NOT NULL," \
+                   "title TEXT NOT NULL," \
+                   "tags TEXT NOT NULL," \
+                   "meta TEXT NOT NULL," \
+                   "body TEXT NOT NULL);"
+page_index_root_index = "CREATE INDEX IF NOT EXISTS page_index_root ON page_index (root);"
+
+# tags of the pages in the page index, one row per page and tag. Written together with the page_index rows so
+# only the tags a page actually lists are stored
+page_index_tag_table = "CREATE TABLE IF NOT EXISTS page_index_tag (" \
+                       "path TEXT NOT NULL REFERENCES page_index(path) ON DELETE CASCADE," \
+                       "tag TEXT NOT NULL," \
+                       "PRIMARY KEY(path, tag)) WITHOUT ROWID;"
+page_index_tag_index = "CREATE INDEX IF NOT EXISTS page_index_tag_tag ON page_index_tag (tag, path);"
+
+# full text index over the page index. The trigram tokenizer matches any substring of at least three characters
+# regardless of case, the triggers keep it in sync with every change to page_index
+page_search_table = "CREATE VIRTUAL TABLE IF NOT EXISTS page_search USING fts5(" \
+                    "title, tags, body, content='page_index', tokenize='trigram');"
+page_search_triggers = (
+    "CREATE TRIGGER IF NOT EXISTS page_index_ai AFTER INSERT ON page_index BEGIN "
+    "INSERT INTO page_search (rowid, title, tags, body) VALUES (new.rowid, new.title, new.tags, new.body); END;",
+    "CREATE TRIGGER IF NOT EXISTS page_index_ad AFTER DELETE ON page_index BEGIN "
+    "INSERT INTO page_search (page_search, rowid, title, tags, body) "
+    "VALUES ('delete', old.rowid, old.title, old.tags, old.body); END;",
+    "CREATE TRIGGER IF NOT EXISTS page_index_au AFTER UPDATE ON page_index BEGIN "
+    "INSERT INTO page_search (page_search, rowid, title, tags, body) "
+    "VALUES ('delete', old.rowid, old.title, old.tags, old.body); "
+    "INSERT INTO page_search (rowid, title, tags, body) VALUES (new.rowid, new.title, new.tags, new.body); END;")
+
+# columns of each wiki table, identifiers passed to find_rows are checked against these since they cannot be
+# bound as parameters
+table_columns = {"pages": ("id", "name", "title", "body"),
+                 "tags": ("name",),
+                 "page_tag": ("page_id", "tag_id")}
+
+# single row insert statements, kept as constants so the connection's statement cache is reused
+insert_page_sql = "INSERT INTO pages VALUES (null,?,?,?)"
+insert_tag_sql = "INSERT INTO tags VALUES (?)"
+insert_page_tag_sql = "INSERT INTO page_tag (page_id, tag_id) VALUES (?,?)"
+link_page_tag_sql = "INSERT OR IGNORE INTO page_tag (page_id, tag_id) SELECT id, ? FROM pages WHERE name = ? AND title = ?"
+
+# unindexed staging table used by bulk_load_page_tags
+create_page_tag_load_sql = "CREATE TEMP TABLE page_tag_load (page_id INTEGER, tag_id TEXT)"
+move_page_tag_load_sql = "INSERT INTO page_tag (page_id, tag_id) SELECT DISTINCT page_id, tag_id FROM page_tag_load"
+drop_page_tag_load_sql = "DROP TABLE IF EXISTS temp.page_tag_load"
+
+# page index statements
+select_page_index_sql = "SELECT path, mtime, size FROM page_index WHERE root = ?"
+# an upsert rather than INSERT OR REPLACE, the rows REPLACE deletes do not fire the delete trigger
+upsert_page_index_sql = "INSERT INTO page_index (path, root, mtime, size, title, tags, meta, body) " \
+                        "VALUES (?,?,?,?,?,?,?,?) ON CONFLICT(path) DO UPDATE SET root = excluded.root, " \
+                        "mtime = excluded.mtime, size = excluded.size, title = excluded.title, " \
+                        "tags = excluded.tags, meta = excluded.meta, body = excluded.body"
+delete_page_index_sql = "DELETE FROM page_index WHERE path = ?"
+insert_page_index_tag_sql = "INSERT OR IGNORE INTO page_index_tag (path, tag) VALUES (?,?)"
+delete_page_index_tags_sql = "DELETE FROM page_index_tag WHERE path = ?"
+select_page_index_tags_sql = "SELECT page_index_tag.tag, page_index_tag.path FROM page_index_tag " \
+                             "JOIN page_index ON page_index.path = page_index_tag.path " \
+                             "WHERE page_index.root = ? ORDER BY page_index_tag.tag"
+select_tagged_page_index_sql = "SELECT page_index_tag.path FROM page_index_tag " \
+                               "JOIN page_index ON page_index.path = page_index_tag.path " \
+                               "WHERE page_index_tag.tag = ? AND page_index.root = ?"
+search_page_index_sql = "SELECT page_index.path FROM page_search JOIN page_index ON page_index.rowid = page_search.rowid " \
+                        "WHERE page_search MATCH ? AND page_index.root = ?"
+
+# number of prepared statements each connection keeps cached
+cached_statements = 256
+
+# connection settings applied on open: write-ahead logging with NORMAL sync only fsyncs on checkpoint
+# instead of twice per transaction, and a 64 MiB page cache keeps bulk transactions in memory. The busy timeout
+# makes concurrent requests wait for a lock instead of failing with "database is locked"
+connection_pragmas = ("PRAGMA synchronous=NORMAL",
+                      "PRAGMA temp_store=MEMORY",
+                      "PRAGMA cache_size=-65536",
+                      "PRAGMA busy_timeout=5000",
+                      "PRAGMA foreign_keys=ON")
+
+# transactions opened by bulk() take the write lock right away. A deferred transaction that reads before writing
+# fails with "database is locked" when it has to upgrade its lock, without waiting for the busy timeout
+begin_sql = "BEGIN IMMEDIATE"
+
+# journal mode for file databases, in-memory databases have no journal file to switch
+wal_pragma = "PRAGMA journal_mode=WAL"
+
+# name used to open a database that only lives in memory
+memory_database = ":memory:"
+
+# maximum number of bound parameters SQLite accepts in a single statement
+SQLITE_MAX_VARIABLES = 999
+
+
+def _synchronized(method):
+    """ Run a Database method while holding the lock of its connection, the connection and its cursor are
+    shared by every thread of the process
+    :param method: the method to wrap
+    :return: the wrapped method"""
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
 
 class Database(object):
-    def __init__(self, database_name):
-        self.path = os.path.dirname(os.path.realpath(__file__)) + "\\%s.db" % database_name
-        self.conn = self.create_connection()
+    # open connections with their shared cursor, lock and number of Database objects using them keyed on
+    # database path, so every Database object for the same file reuses one connection per process instead
+    # of opening a new one
+    _connections = {}
+    _connections_lock = Lock()
+
+    def __init__(self, database_name, directory=None):
+        self.path = self.get_path(database_name, directory)
+        self._closed = False
+        if self.path == memory_database:
+            # every connection to :memory: is a database of its own, so those are never shared
+            conn = self.create_connection()
+            self._shared = [conn, conn.cursor() if conn else None, RLock(), 1]
+        else:
+            with self._connections_lock:
+                self._shared = self._connections.get(self.path)
+                if self._shared is None:
+                    conn = self.create_connection()
+                    self._shared = [conn, conn.cursor() if conn else None, RLock(), 0]
+                    if conn is not None:
+                        self._connections[self.path] = self._shared
+                self._shared[3] += 1
+        # long-lived cursor shared by all methods instead of allocating one per call, the lock serializes
+        # the threads using it
+        self.conn, self._c, self._lock = self._shared[:3]
+
+    @staticmethod
+    def get_path(database_name, directory=None):
+        """ Get the path of a database file, the databases are in the module's directory by default
+        :param database_name: name of the database without the .db extension
+        :param directory: directory holding the database
+        :return: the path"""
+        if database_name == memory_database:
+            return memory_database
+        return os.path.join(directory or _module_dir, "%s.db" % database_name)
+
+    @classmethod
+    def close_shared_connection(cls, database_name, directory=None):
+        """ Close the connection shared by every Database for a file if one is open, e.g. before the file
+        is removed. Unlike close_connection this closes it for all Database objects using it
+        :param database_name: name of the database without the .db extension
+        :param directory: directory holding the database
+        :return: """
+        with cls._connections_lock:
+            shared = cls._connections.pop(cls.get_path(database_name, directory), None)
+        if shared is not None:
+            cls._close_shared(shared)
+
+    @staticmethod
+    def _close_shared(shared):
+        """ Close a shared connection and its cursor once no thread is using them
+        :param shared: the connection, cursor, lock and reference count
+        :return: """
+        conn, cursor, lock = shared[:3]
+        if conn is None:
+            return
+        with lock:
+            try:
+                cursor.close()
+                conn.close()
+            except Error as e:
+                print(e)
 
     def create_connection(self):
         """" create connection object to SQLite Database and create database if it doesn't exist
          :return Connectin object or None"""
         try:
-            conn = sqlite3.connect(self.path)
+            # autocommit mode, transactions are only opened explicitly by bulk(). The connection is shared
+            # by every Database for the same path, so it may be used from more than one request thread
+            conn = sqlite3.connect(self.path, cached_statements=cached_statements, isolation_level=None,
+                                   check_same_thread=False)
+            if self.path != memory_database:
+                conn.execute(wal_pragma)
+            for pragma in connection_pragmas:
+                conn.execute(pragma)
             return conn
         except Error as e:
             print(e)
@@ -38,70 +219,246 @@ class Database(object):
         return None
 
     def close_connection(self):
-        ''' Close the connection to the database'''
+        ''' Close the connection to the database. The connection is shared by every Database object for the
+        same file, it is only closed once all of them closed it and the others keep working until then'''
+        if self._closed:
+            return
+        self._closed = True
+        with self._connections_lock:
+            self._shared[3] -= 1
+            if self._shared[3] > 0:
+                return
+            if self._connections.get(self.path) is self._shared:
+                del self._connections[self.path]
+        self._close_shared(self._shared)
+
+    @contextmanager
+    def bulk(self):
+        """ Run a batch of statements inside a single transaction so the database is only synced once
+            on commit instead of after every row. Outside of this block every statement commits on its own
+            because the connection is in autocommit mode. Rolls the transaction back if an exception is raised.
+            The connection's lock is held for the whole block, so other threads cannot run statements inside
+            the transaction.
+            :return: """
+        with self._lock:
+            if self.conn.in_transaction:
+                # already inside a bulk transaction, possibly opened by another Database on the same connection
+                yield self
+                return
+            self._c.execute(begin_sql)
+            try:
+                yield self
+            except:
+                self.conn.rollback()
+                raise
+            else:
+                self.conn.commit()
+
+    @_synchronized
+    def _run_script(self, statements):
+        """ Run several sql statements with one executescript call inside a single transaction, the
+        transaction is rolled back if one of the statements fails
+        :param statements: list of sql statements
+        :return:
+        """
         try:
-            self.conn.close()
-        except Error as e:
-            print(e)
+            self._c.executescript("%s;\n%s\nCOMMIT;" % (begin_sql, "\n".join(statements)))
+        except Error:
+            if self.conn.in_transaction:
+                self.conn.rollback()
+            raise
 
+    @_synchronized
     def create_table(self, create_string):
         """ create a table in database using sql string
         :param create_string: the sql statement to create table
         :return:
         """
-        try:
-            c = self.conn.cursor()
-            c.execute(create_string)
-            self.conn.commit()
-        except Error as e:
-            print(e)
+        self._c.execute(create_string)
 
+    def create_tables(self, *create_strings):
+        """ create several tables with one executescript call instead of one statement per table, runs as its
+        own transaction so it should not be called inside bulk()
+        :param create_strings: the sql statements to create the tables
+        :return:
+        """
+        self._run_script(create_strings)
+
+    @_synchronized
     def drop_table(self, table_name):
         """ Drop a table within the database
             :param table_name: name of table to be deleted
             :return: message indicating table deletion successful or failed
             """
-        try:
-            c = self.conn.cursor()
-            c.execute("DROP TABLE " + table_name)
-            self.conn.commit()
-        except Error as e:
-            print(e)
+        self._c.execute("DROP TABLE " + table_name)
 
+    @_synchronized
     def insert_page(self, name, title, body):
         """ Insert a new page in the page table
             :param name: name of the page
             :param title: title for the new page
             :param body: content on the page
             :return: """
-        try:
-            c = self.conn.cursor()
-            c.execute("INSERT INTO pages VALUES (null,?,?,?)",(name, title, body))
-            self.conn.commit()
-        except Error as e:
-            print(e)
+        self._c.execute(insert_page_sql, (name, title, body))
 
+    @_synchronized
     def insert_tag(self, name):
         """ Insert a new page in the page table
             :param name: name of tag being created
             :return: """
-        try:
-            c = self.conn.cursor()
-            c.execute("INSERT INTO tags VALUES (?)",(name,))
-            self.conn.commit()
-        except Error as e:
-            print(e)
+        self._c.execute(insert_tag_sql, (name,))
 
+    @_synchronized
     def insert_page_tag(self,page_num,tag_name):
         '''Insert an entry into the junction table for each tag on a page'''
-        try:
-            c = self.conn.cursor()
-            c.execute("INSERT INTO page_tag (page_id, tag_id) VALUES (?,?)", (page_num,tag_name))
-            self.conn.commit()
-        except Error as e:
-            print(e)
+        self._c.execute(insert_page_tag_sql, (page_num, tag_name))
+
+    def _insert_many(self, table_name, columns, rows, conflict=None):
+        """ Insert rows using multi-row VALUES statements, split into chunks that stay under SQLite's
+            limit of 999 bound parameters per statement
+            :param table_name: table the rows are inserted into
+            :param columns: list of column names matching the order of values in each row
+            :param rows: iterable of tuples holding one value per column
+            :param conflict: optional conflict clause, e.g. "IGNORE" for INSERT OR IGNORE
+            :return: """
+        rows = list(rows)
+        chunk_size = SQLITE_MAX_VARIABLES // len(columns)
+        verb = "INSERT OR %s" % conflict if conflict else "INSERT"
+        placeholder = "(" + ",".join("?" * len(columns)) + ")"
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start:start + chunk_size]
+            query = "%s INTO %s (%s) VALUES %s" % (verb, table_name, ",".join(columns),
+                                                   ",".join([placeholder] * len(chunk)))
+            self._c.execute(query, [value for row in chunk for value in row])
+
+    def insert_pages(self, rows):
+        """ Insert several pages in the page table in as few statements as possible. Batch inserts always run
+            in a single transaction, joining the caller's bulk() transaction if one is open
+            :param rows: iterable of (name, title, body) tuples
+            :return: """
+        with self.bulk():
+            self._insert_many("pages", ["name", "title", "body"], rows)
+
+    def insert_tags(self, names):
+        """ Insert several tags in the tags table, tags that already exist are skipped
+            :param names: iterable of tag names
+            :return: """
+        with self.bulk():
+            self._insert_many("tags", ["name"], ((name,) for name in names), conflict="IGNORE")
+
+    def insert_page_tags(self, pairs):
+        '''Insert several entries into the junction table
+        :param pairs: iterable of (page_id, tag_name) tuples'''
+        with self.bulk():
+            self._insert_many("page_tag", ["page_id", "tag_id"], pairs)
+
+    def bulk_insert_json(self, table_name, columns, rows):
+        """ Insert a batch of rows with a single statement by passing them to SQLite as one JSON array
+            that is unpacked with json_each, so no Python call is made per row. Runs in a single transaction,
+            joining the caller's bulk() transaction if one is open
+            :param table_name: table the rows are inserted into
+            :param columns: list of column names, each one a key in the row dictionaries
+            :param rows: list of dictionaries mapping column names to values
+            :return: """
+        # the names are put into the statement, so only known tables and columns are accepted
+        known_columns = table_columns.get(table_name)
+        if known_columns is None:
+            raise ValueError("Unknown table: %s" % table_name)
+        for col in columns:
+            if col not in known_columns:
+                raise ValueError("Unknown column for %s: %s" % (table_name, col))
+        query = "INSERT INTO %s (%s) SELECT %s FROM json_each(?)" % (
+            table_name, ",".join(columns), ",".join(["json_extract(value, '$.%s')" % col for col in columns]))
+        with self.bulk():
+            self._c.execute(query, (json.dumps(rows),))
+
+    def link_page_tags(self, triples):
+        '''Insert junction table entries for pages identified by name and title, the page ids are looked up
+        by SQLite as part of the insert instead of with a separate query per page
+        :param triples: iterable of (page_name, page_title, tag_name) tuples'''
+        with self.bulk():
+            self._c.executemany(link_page_tag_sql, ((tag, name, title) for (name, title, tag) in triples))
+
+    def bulk_load_page_tags(self, pairs):
+        '''Load a large batch of junction table entries. The rows are first copied into an unindexed
+        temporary table and then moved into page_tag in one statement, so the primary key index is
+        updated once for the whole batch instead of once per inserted row.
+        :param pairs: iterable of (page_id, tag_name) tuples'''
+        with self.bulk():
+            self._c.execute(drop_page_tag_load_sql)
+            self._c.execute(create_page_tag_load_sql)
+            self._insert_many("page_tag_load", ["page_id", "tag_id"], pairs)
+            self._c.execute(move_page_tag_load_sql)
+            self._c.execute(drop_page_tag_load_sql)
+
+    @_synchronized
+    def get_page_index(self, root):
+        """ Get the cached metadata of every page stored under a content directory
+        :param root: absolute path of the content directory
+        :return: dictionary mapping page paths to (mtime, size) tuples"""
+        self._c.execute(select_page_index_sql, (root,))
+        return {row[0]: row[1:] for row in self._c.fetchall()}
+
+    @_synchronized
+    def get_page_index_entries(self, paths):
+        """ Get the stored metadata and body of the given pages, looked up in chunks that stay under SQLite's
+            limit of bound parameters
+        :param paths: list of page paths
+        :return: dictionary mapping page paths to (meta, body) tuples"""
+        entries = {}
+        for start in range(0, len(paths), SQLITE_MAX_VARIABLES):
+            chunk = paths[start:start + SQLITE_MAX_VARIABLES]
+            self._c.execute("SELECT path, meta, body FROM page_index WHERE path IN (%s)" %
+                            ",".join("?" * len(chunk)), chunk)
+            entries.update((row[0], row[1:]) for row in self._c.fetchall())
+        return entries
+
+    def update_page_index(self, rows, removed_paths=(), page_tags=()):
+        """ Store the metadata of new or changed pages and drop the entries of removed ones in one transaction.
+            The tags stored for the changed pages are replaced with the given ones, the tags of removed pages
+            are deleted with them
+        :param rows: iterable of (path, root, mtime, size, title, tags, meta, body) tuples
+        :param removed_paths: iterable of paths of pages that no longer exist
+        :param page_tags: iterable of (path, tag) tuples holding every tag of the changed pages
+        :return: """
+        rows = list(rows)
+        with self.bulk():
+            self._c.executemany(upsert_page_index_sql, rows)
+            self._c.executemany(delete_page_index_tags_sql, ((row[0],) for row in rows))
+            self._c.executemany(insert_page_index_tag_sql, page_tags)
+            self._c.executemany(delete_page_index_sql, ((path,) for path in removed_paths))
+
+    @_synchronized
+    def get_page_index_tags(self, root):
+        """ Get the tags of every page stored under a content directory, ordered by tag
+        :param root: absolute path of the content directory
+        :return: list of (tag, path) tuples"""
+        self._c.execute(select_page_index_tags_sql, (root,))
+        return self._c.fetchall()
 
+    @_synchronized
+    def get_tagged_page_index(self, root, tag):
+        """ Get the pages under a content directory that carry a tag
+        :param root: absolute path of the content directory
+        :param tag: the tag name
+        :return: set of page paths"""
+        self._c.execute(select_tagged_page_index_sql, (tag, root))
+        return {row[0] for row in self._c.fetchall()}
 
+    @_synchronized
+    def search_page_index(self, root, *texts):
+        """ Find the pages under a content directory whose title, tags or body contain every one of the pieces
+            of text, ignoring case. Needs the page_search table, and text shorter than three characters never
+            matches
+        :param root: absolute path of the content directory
+        :param texts: the pieces of text to look for
+        :return: set of page paths"""
+        # each piece is quoted as a phrase so the text is not parsed as FTS5 query syntax
+        query = " AND ".join('"%s"' % text.replace('"', '""') for text in texts)
+        self._c.execute(search_page_index_sql, (query, root))
+        return {row[0] for row in self._c.fetchall()}
+
+    @_synchronized
     def find_rows(self, select_columns, table_name, count_check, search_criteria=None, order_by=None, row_limit=0, offset=0,
                   group_by=None, having_criteria=None):
         """
@@ -110,7 +467,8 @@ class Database(object):
         :param table_name: table to be queried
         :param count_check: determine whether to use the COUNT function or not. (CAN LATER BE CHANGED TO ACCOUNT
         FOR OTHER SPECIAL CASES WITH SELECT STATEMENTS)
-        :param search_criteria: expressions to specify desired qualities of the rows in the table
+        :param search_criteria: expressions to specify desired qualities of the rows in the table, or a dictionary
+        mapping column names to values which are matched for equality with bound parameters
         :param order_by: expression to order selection of rows from table
         :param row_limit: limit the number of rows searched from the table
         :param offset: specify first row selected from given conditions
@@ -118,32 +476,33 @@ class Database(object):
         :param having_criteria: criteria for grouping selected rows
         :return: list of rows from query
         """
-        try:
-            c = self.conn.cursor()
-            if count_check is False:
-                query = "SELECT %s FROM %s" % (select_columns, table_name)
-            else:
-                query = "SELECT COUNT(%s) FROM %s" % (select_columns, table_name)
-            if search_criteria is not None:
-                query = query + (" WHERE %s" % search_criteria)
-            if order_by is not None:
-                query = query + (" ORDER BY %s" % order_by)
-            if row_limit is not 0:
-                query = query + (" LIMIT %s" % str(row_limit))
-            if offset is not 0:
-                query = query + (" OFFSET %s" % str(offset))
-            if group_by is not None:
-                query = query + (" GROUP BY %s" % group_by)
-            if having_criteria is not None:
-                query = query + (" HAVING %s" % having_criteria)
-            c.execute(query)
-            self.conn.commit()
-            return c.fetchall()
-            # return query
-        except Error as e:
-            print(e)
+        c = self._c
+        columns = table_columns.get(table_name)
+        if columns is None:
+            raise ValueError("Unknown table: %s" % table_name)
+        if select_columns != "*":
+            for col in select_columns.split(","):
+                if col.strip() not in columns:
+                    raise ValueError("Unknown column for %s: %s" % (table_name, col.strip()))
+        params = []
+        if isinstance(search_criteria, dict):
+            criteria_cols = sorted(search_criteria)
+            for col in criteria_cols:
+                if col not in columns:
+                    raise ValueError("Unknown column for %s: %s" % (table_name, col))
+            params.extend([search_criteria[col] for col in criteria_cols])
+            search_criteria = " AND ".join(["%s = ?" % col for col in criteria_cols])
+        query = _select_query(select_columns, table_name, count_check, search_criteria, order_by,
+                              row_limit != 0, offset != 0, group_by, having_criteria)
+        if row_limit != 0:
+            params.append(row_limit)
+        if offset != 0:
+            params.append(offset)
+        c.execute(query, params)
+        return c.fetchall()
 
 
+    @_synchronized
     def update_table(self, table_name, change_cols, change_values, search_criteria=None, order_by=None,
                      row_limit=0, offset=0):
         """ Update an entry in the pages table
@@ -156,48 +515,95 @@ class Database(object):
         :param offset: number of rows left unchanged from selection before altering table
         :return row ids of changed rows in table"""
 
-        try:
-            c = self.conn.cursor()
-            # establish initial line with first required change to table with for loop for multiple changes
-            query = "UPDATE %s SET %s = '%s'" % (table_name, change_cols[0], change_values[0])
-            if len(change_cols) > 1:
-                for i in range(1, len(change_cols)):
-                    query = query + ", %s = '%s'" % (change_cols[i], change_values[i])
-            if search_criteria is not None:
-                query = query + " WHERE %s" % search_criteria
-            if order_by is not None:
-                query = query + (" ORDER BY %s" % order_by)
-            if row_limit is not 0:
-                query = query + (" LIMIT %s" % str(row_limit))
-            if offset is not 0:
-                query = query + (" OFFSET %s" % str(offset))
-            c.execute(query)
-            self.conn.commit()
-            # return query
-        except Error as e:
-            print(e)
+        c = self._c
+        query = _update_query(table_name, tuple(change_cols), search_criteria, order_by,
+                              row_limit != 0, offset != 0)
+        params = list(change_values)
+        if row_limit != 0:
+            params.append(row_limit)
+        if offset != 0:
+            params.append(offset)
+        c.execute(query, params)
 
 
+    @_synchronized
     def delete_row(self,table_name, search_criteria = None):
         ''' Delete row from page table
         :param table_name: name of the table
         :param search_criteria: conditional expressions used for querying table
         :return id of row deleted'''
 
-        try:
-            c = self.conn.cursor()
-            # establish initial line with first required change to table with for loop for multiple changes
+        c = self._c
+        if search_criteria is not None:
+            query = "DELETE FROM %s WHERE %s" % (table_name, search_criteria)
+        else:
             query = "DELETE FROM %s" % table_name
-            if search_criteria is not None:
-                query = query + " WHERE %s" % search_criteria
-            c.execute(query)
-            self.conn.commit()
-        except Error as e:
-            print(e)
+        c.execute(query)
+
+
+    def reset_tables(self, table_names):
+        ''' Delete every row from the given tables and reset their AUTOINCREMENT counters in one transaction
+        :param table_names: list of table names, tables referenced by foreign keys must come after the
+        tables referencing them'''
+        statements = ["DELETE FROM %s;" % name for name in table_names]
+        statements.append("DELETE FROM sqlite_sequence WHERE name IN (%s);" %
+                          ",".join(["'%s'" % name for name in table_names]))
+        self._run_script(statements)
+
+
+@lru_cache(maxsize=128)
+def _select_query(select_columns, table_name, count_check, search_criteria, order_by, has_limit, has_offset,
+                  group_by, having_criteria):
+    """ Build the SELECT statement used by Database.find_rows. Limit and offset are left as ? placeholders,
+    so the same text is returned for every page of a query and SQLite's statement cache is hit.
+    :return: sql string"""
+    if count_check is False:
+        parts = ["SELECT %s FROM %s" % (select_columns, table_name)]
+    else:
+        parts = ["SELECT COUNT(%s) FROM %s" % (select_columns, table_name)]
+    if search_criteria is not None:
+        parts.append("WHERE %s" % search_criteria)
+    if group_by is not None:
+        parts.append("GROUP BY %s" % group_by)
+    if having_criteria is not None:
+        parts.append("HAVING %s" % having_criteria)
+    if order_by is not None:
+        parts.append("ORDER BY %s" % order_by)
+    parts.extend(_limit_clauses(has_limit, has_offset))
+    return " ".join(parts)
+
+
+@lru_cache(maxsize=128)
+def _update_query(table_name, change_cols, search_criteria, order_by, has_limit, has_offset):
+    """ Build the UPDATE statement used by Database.update_table with a ? placeholder for every new value,
+    the limit and the offset.
+    :return: sql string"""
+    parts = ["UPDATE %s SET" % table_name, ", ".join(["%s = ?" % col for col in change_cols])]
+    if search_criteria is not None:
+        parts.append("WHERE %s" % search_criteria)
+    if order_by is not None:
+        parts.append("ORDER BY %s" % order_by)
+    parts.extend(_limit_clauses(has_limit, has_offset))
+    return " ".join(parts)
+
+
+def _limit_clauses(has_limit, has_offset):
+    """ LIMIT/OFFSET clauses with ? placeholders, sqlite only accepts OFFSET after a LIMIT so -1 (no limit)
+    is used when only an offset is given
+    :return: list of sql clauses"""
+    parts = []
+    if has_limit:
+        parts.append("LIMIT ?")
+    elif has_offset:
+        parts.append("LIMIT -1")
+    if has_offset:
+        parts.append("OFFSET ?")
+    return parts
+
 
 # create isntance of database
-def create_db_instance(database_name):
+def create_db_instance(database_name, directory=None):
     if database_name != "":
-        db_instance = Database(database_name)
+        db_instance = Database(database_name, directory)
         return db_instance
     return None
\ No newline at end of file
@@ -2,21 +2,57 @@
     Wiki core
     ~~~~~~~~~
 """
+from collections import defaultdict
 from collections import OrderedDict
+from functools import lru_cache
 from io import open
+import json
 import os
 import re
+from sqlite3 import Error
+import threading
+from threading import Lock
 
 from flask import abort
 from flask import url_for
-import markdown
 import ntpath
 from wiki.Database import create_db_instance
+from wiki.Database import Database
+from wiki.Database import page_index_root_index
+from wiki.Database import page_index_table
+from wiki.Database import page_index_tag_index
+from wiki.Database import page_index_tag_table
+from wiki.Database import page_search_table
+from wiki.Database import page_search_triggers
+
+# name of the database in the content directory caching the metadata of every page
+INDEX_DATABASE = ".index"
+
+# matches the version suffix of an extensionless filename, 'myfile_v2' -> '_v2'
+_VERSION_SUFFIX_RE = re.compile(r'_v(\d+)$')
+
+# characters with a special meaning in a regular expression, search terms
+# without them are plain text that the full text index can look up
+_REGEX_SPECIAL_RE = re.compile(r'[.^$*+?{}\[\]\\|()]')
+
+# page attributes held by the full text index
+_SEARCH_INDEX_ATTRS = frozenset(('title', 'tags', 'body'))
+
+# ascii letters that re.IGNORECASE also matches to non-ascii characters the
+# full text index may not fold to them: i to 'İ' and 'ı', k to the kelvin
+# sign and s to the long s
+_CASE_FOLD_SPLIT_RE = re.compile(r'[iks]', re.IGNORECASE)
+
+# wikilink syntax, [[url]] or [[url|title]], outside of code blocks
+_LINK_RE = re.compile(
+    r"((?<!\<code\>)\[\[([^<].+?) \s*([|] \s* (.+?) \s*)?]])",
+    re.X | re.U
+)
 
 def clean_url(url):
     """
         Cleans the url and corrects various errors. Removes multiple
-        spaces and all leading and trailing spaces. Changes spaces
+        whitespace and all leading and trailing whitespace. Changes spaces
         to underscores and makes all characters lowercase. Also
         takes care of Windows style folders use.
 
@@ -26,7 +62,8 @@ def clean_url(url):
         :returns: the cleaned url
         :rtype: str
     """
-    url = re.sub('[ ]{2,}', ' ', url).strip()
+    # split() drops leading and trailing whitespace and runs of it in one go
+    url = ' '.join(url.split())
     url = url.lower().replace(' ', '_')
     url = url.replace('\\\\', '/').replace('\\', '/')
     return url
@@ -53,19 +90,43 @@ def wikilink(text, url_formatter=None):
     """
     if url_formatter is None:
         url_formatter = url_for
-    link_regex = re.compile(
-        r"((?<!\<code\>)\[\[([^<].+?) \s*([|] \s* (.+?) \s*)?]])",
-        re.X | re.U
-    )
-    for i in link_regex.findall(text):
-        title = [i[-1] if i[-1] else i[1]][0]
-        url = clean_url(i[1])
-        html_url = u"<a href='{0}'>{1}</a>".format(
+
+    def replace_link(match):
+        title = match.group(4) or match.group(2)
+        url = clean_url(match.group(2))
+        return u"<a href='{0}'>{1}</a>".format(
             url_formatter('wiki.display', url=url),
             title
         )
-        text = re.sub(link_regex, html_url, text, count=1)
-    return text
+
+    # a single pass over the text instead of one substitution per link
+    return _LINK_RE.sub(replace_link, text)
+
+
+# markdown converters are expensive to set up but not thread safe, so every
+# thread builds one on first use and resets it between documents
+_markdown = threading.local()
+
+
+def _get_markdown():
+    """
+        Gets the markdown converter of the current thread.
+
+        :returns: the converter with the wiki's extensions loaded
+        :rtype: markdown.Markdown
+    """
+    md = getattr(_markdown, 'md', None)
+    if md is None:
+        # imported on first use, workers that never render markdown do
+        # not load it
+        import markdown
+        md = _markdown.md = markdown.Markdown([
+            'codehilite',
+            'fenced_code',
+            'meta',
+            'tables'
+        ])
+    return md
 
 
 class Processor(object):
@@ -86,12 +147,7 @@ class Processor(object):
 
             :param str text: the text to process
         """
-        self.md = markdown.Markdown([
-            'codehilite',
-            'fenced_code',
-            'meta',
-            'tables'
-        ])
+        self.md = _get_markdown()
         self.input = text
         self.markdown = None
         self.meta_raw = None
@@ -114,6 +170,7 @@ class Processor(object):
         """
             Convert to HTML.
         """
+        self.md.reset()
         self.html = self.md.convert(self.pre)
 
 
@@ -165,11 +222,125 @@ class Processor(object):
         return self.final, self.markdown, self.meta
 
 
+@lru_cache(maxsize=128)
+def _compile_search(term, ignore_case):
+    """
+        Compiles a search term, recurring searches reuse the pattern.
+
+        :param str term: the regular expression to search for
+        :param bool ignore_case: whether the case is ignored
+
+        :returns: the compiled pattern
+    """
+    return re.compile(term, re.IGNORECASE if ignore_case else 0)
+
+
+class _MarkdownProcessor(Processor):
+    """
+        Processor leaving out the postprocessors, so it can run without
+        the flask context and its result does not depend on the request.
+    """
+
+    postprocessors = []
+
+
+def _search_index_fragments(term, ignore_case):
+    """
+        Splits a plain text search term into the pieces the full text
+        index is asked for. Every page the term matches contains all of
+        them, the index never folds case differently than the regex.
+
+        :param str term: the plain text to search for
+        :param bool ignore_case: whether the case is ignored
+
+        :returns: the pieces, empty if the index cannot be used
+        :rtype: list
+    """
+    if not ignore_case:
+        fragments = [term]
+    elif term.isascii():
+        fragments = _CASE_FOLD_SPLIT_RE.split(term)
+    else:
+        # the index folds case differently than python outside of ascii
+        return []
+    # the trigram index only finds pieces of three characters or more
+    return [fragment for fragment in fragments if len(fragment) >= 3]
+
+
+@lru_cache(maxsize=512)
+def _render_cached(text):
+    """
+        Renders the markdown of the given text, remembering the result
+        so pages with identical content are only converted once. The
+        postprocessors are left out, the urls of wikilinks depend on the
+        request.
+
+        :param str text: the full content of a page file
+
+        :returns: the html before postprocessing, the body and the
+            (key, value) pairs of the metadata, as a tuple so the cached
+            result cannot be changed
+        :rtype: tuple
+    """
+    html, body, meta = _MarkdownProcessor(text).process()
+    return html, body, tuple(meta.items())
+
+
+def render(text):
+    """
+        Renders the given text to html, sharing the cache of rendered
+        pages.
+
+        :param str text: the text to render, metadata followed by the
+            markdown body
+
+        :returns: the processed html
+        :rtype: str
+    """
+    return postprocess(render_markdown(text))
+
+
+def render_markdown(text):
+    """
+        Renders the given text to html like :func:`render` but without
+        running the postprocessors, e.g. in a worker process where the
+        urls of wikilinks cannot be built. :func:`postprocess` finishes
+        the html.
+
+        :param str text: the text to render, metadata followed by the
+            markdown body
+
+        :returns: the html before postprocessing
+        :rtype: str
+    """
+    return _render_cached(text)[0]
+
+
+def postprocess(html):
+    """
+        Runs the postprocessors of the :class:`Processor` over html
+        rendered by :func:`render_markdown`.
+
+        :param str html: the html to postprocess
+
+        :returns: the processed html
+        :rtype: str
+    """
+    for processor in Processor.postprocessors:
+        html = processor(html)
+    return html
+
+
 class Page(object):
     def __init__(self, path, url, new=False):
         self.path = path
         self.url = url
         self._meta = OrderedDict()
+        self._tag_list = None
+        self._html = None
+        # set for pages created from the index, their html is only
+        # rendered once it is accessed
+        self._lazy = False
         if not new:
             self.load()
             self.render()
@@ -177,13 +348,36 @@ class Page(object):
     def __repr__(self):
         return u"<Page: {}@{}>".format(self.url, self.path)
 
+    @classmethod
+    def from_index(cls, path, url, meta, body):
+        """
+            Creates a page from the metadata stored in the wiki index
+            without reading or rendering its file.
+
+            :param str path: the path of the page file
+            :param str url: the url of the page
+            :param list meta: the (key, value) pairs of the page metadata
+            :param str body: the text of the page without its metadata
+
+            :returns: the page
+            :rtype: Page
+        """
+        page = cls(path, url, new=True)
+        page._meta = OrderedDict(meta)
+        page.body = body
+        page._lazy = True
+        return page
+
     def load(self):
         with open(self.path, 'r', encoding='utf-8') as f:
             self.content = f.read()
 
     def render(self):
-        processor = Processor(self.content)
-        self._html, self.body, self._meta = processor.process()
+        # the html is kept before postprocessing, the wikilinks are
+        # built for the request showing the page
+        self._html, self.body, meta = _render_cached(self.content)
+        self._meta = OrderedDict(meta)
+        self._lazy = False
 
     @staticmethod
     def get_filename_from_path(path):
@@ -227,7 +421,7 @@ class Page(object):
         Expects an extensionless filename and removes _v# from the end
         'myfile_v1' -> 'myfile'
         """
-        return re.sub(r'_v\d+$', '', filename)
+        return _VERSION_SUFFIX_RE.sub('', filename)
 
     @staticmethod
     def __get_all_versions_of_unversioned_file(path, unversioned_filename, ext):
@@ -238,13 +432,22 @@ class Page(object):
         Gets all versions of a file
         'myfile' -> ['path/to/myfile_v1.txt', 'path/to/myfile_v2.txt']
         """
+        # versions are siblings of the file, so only its own directory is
+        # listed instead of walking every folder below it
+        suffix = '.' + ext
         files_to_return = []
-        for root, dirs, files in os.walk(path):
-            for f in files:
-                temp = f.replace(unversioned_filename, '', 1)   # Remove the filename
-                temp = temp.replace('.' + ext, '')              # Remove the extension
-                if re.match(r'^_v\d+$', temp):                  # Only the version should be left
-                    files_to_return.append(f)
+        try:
+            entries = os.scandir(path or os.curdir)
+        except FileNotFoundError:
+            # a page in a new folder has no versions yet
+            return files_to_return
+        with entries:
+            for entry in entries:
+                name = entry.name
+                if (name.startswith(unversioned_filename) and name.endswith(suffix) and
+                        _VERSION_SUFFIX_RE.match(name[len(unversioned_filename):-len(suffix)]) and
+                        entry.is_file()):
+                    files_to_return.append(name)
         return files_to_return
 
     @staticmethod
@@ -270,12 +473,13 @@ class Page(object):
         'myfile_v1.txt' - > 1
         """
         temp_file = Page.__get_filename_without_extension(filename)
-        version = re.findall('^.*([0-9]+)$', temp_file)
+        # the whole number after _v, not just its last digit
+        match = _VERSION_SUFFIX_RE.search(temp_file)
 
-        if len(version) == 0:
+        if match is None:
             return 0
         else:
-            return int(version[0])
+            return int(match.group(1))
 
     @staticmethod
     def __get_highest_version_number(file_list):
@@ -308,6 +512,31 @@ class Page(object):
         unversioned_filename = Page.__get_filename_without_version(filename_ext[0])
         return Page.__get_all_versions_of_unversioned_file(file_path_without_file, unversioned_filename, filename_ext[1])
 
+    @staticmethod
+    def get_version_paths(file_path):
+        """
+        Returns the sorted paths of all versions of a file, only its own
+        directory is listed
+        'path/to/myfile_v2.txt' -> ['path/to/myfile_v1.txt', 'path/to/myfile_v2.txt']
+        """
+        path = Page.get_path_without_filename(file_path)
+        return sorted(os.path.join(path, name) for name in Page.__get_all_versions_of_file(file_path))
+
+    @staticmethod
+    def get_version_key(file_path):
+        """
+        Splits a path into the key shared by all versions of the file and
+        the version number, None if the file is not versioned
+        'path/to/myfile_v2.txt' -> (('path/to', 'myfile', 'txt'), 2)
+        """
+        filename_ext = Page.__split_filename_from_extension(Page.get_filename_from_path(file_path))
+        ext = filename_ext[1] if len(filename_ext) > 1 else ''
+        match = _VERSION_SUFFIX_RE.search(filename_ext[0])
+        if match is None:
+            return (Page.get_path_without_filename(file_path), filename_ext[0], ext), None
+        unversioned_filename = filename_ext[0][:match.start()]
+        return (Page.get_path_without_filename(file_path), unversioned_filename, ext), int(match.group(1))
+
     @staticmethod
     def __get_highest_version_number_from_file_path(file_path):
         """
@@ -349,15 +578,49 @@ class Page(object):
         Returns highest version from a file path, 0 if no version exists
         [Page with 'path/to/myfile_v1.txt', Page with 'path/to/myfile_v2.txt'] -> [Page with 'path/to/myfile_v2.txt']
         """
+        keys = [Page.get_version_key(page.path) for page in pages]
+
+        # the highest version on disk of every file, the given pages may be
+        # a subset of all versions. Each directory is only listed once
+        highest = {}
+        for folder in {key[0] for key, _ in keys}:
+            try:
+                entries = os.scandir(folder or os.curdir)
+            except FileNotFoundError:
+                continue
+            with entries:
+                for entry in entries:
+                    key, version = Page.get_version_key(os.path.join(folder, entry.name))
+                    if version is not None and version > highest.get(key, 0) and entry.is_file():
+                        highest[key] = version
+
         pages_to_return = []
-        for page in pages:
-            p = page.get_highest_version_of_file_path(page.path)
-            if p == page.path:
-                if page not in pages_to_return:
-                    pages_to_return.append(page)
+        seen = set()
+        for (key, version), page in zip(keys, pages):
+            if (version or 0) == highest.get(key, 0) and id(page) not in seen:
+                seen.add(id(page))
+                pages_to_return.append(page)
 
         return pages_to_return
 
+    @staticmethod
+    def get_highest_versions(pages):
+        """
+        Maps the key of every file to the page holding its highest version,
+        in one pass over the pages
+        [Page with 'path/to/myfile_v1.txt', Page with 'path/to/myfile_v2.txt']
+        -> {('path/to', 'myfile', 'txt'): Page with 'path/to/myfile_v2.txt'}
+        """
+        highest = {}
+        versions = {}
+        for page in pages:
+            key, version = Page.get_version_key(page.path)
+            version = version or 0
+            if key not in highest or version > versions[key]:
+                highest[key] = page
+                versions[key] = version
+        return highest
+
     @staticmethod
     def get_versions(filepath, all_versions):
         """
@@ -369,14 +632,19 @@ class Page(object):
         [Page with 'path/to/myfile_v1.txt', Page with 'path/to/myfile_v2.txt', Page with 'path/to/myfile2_v1.txt']
         -> [Page with 'path/to/myfile_v1.txt', Page with 'path/to/myfile_v2.txt']
         """
-        versions = Page.__get_all_versions_of_file(filepath)
-        path = Page.get_path_without_filename(filepath)
-        pages = []
-        for version in versions:
-            for v in all_versions:
-                if os.path.join(path, version) == v.path:
-                    pages.append(v)
-        return pages
+        return list(Page.iter_versions(filepath, all_versions))
+
+    @staticmethod
+    def iter_versions(filepath, all_versions):
+        """
+        Yields the versions of the filepath like get_versions, without
+        collecting them in a list
+        """
+        key = Page.get_version_key(filepath)[0]
+        for v in all_versions:
+            v_key, version = Page.get_version_key(v.path)
+            if version is not None and v_key == key:
+                yield v
 
     @staticmethod
     def get_highest_page_from_unversioned_file(pages, name):
@@ -388,19 +656,19 @@ class Page(object):
         'home' -> Page with home_v2.md
         """
 
-        current_page = None
-        current_version = -1
-
+        # versioned pages keyed on their name without the version, the
+        # versions are taken from the paths instead of listing the disk
+        pages_by_base = {}
         for page in pages:
-            filename = Page.get_filename_from_path(page.path)
-            filename_ext = Page.__split_filename_from_extension(filename)
-            if re.match(name + '_v\d+$', filename_ext[0]):
-                temp_version = Page.__get_highest_version_number_from_file_path(page.path)
-                if temp_version > current_version:
-                    current_page = page
-                    current_version = temp_version
+            key, version = Page.get_version_key(page.path)
+            if version is None:
+                continue
+            highest = pages_by_base.get(key[1])
+            if highest is None or version > highest[0]:
+                pages_by_base[key[1]] = (version, page)
 
-        return current_page
+        highest = pages_by_base.get(name)
+        return highest[1] if highest else None
 
 
     def save(self, update=True):
@@ -414,18 +682,22 @@ class Page(object):
         filename = Page.__get_filename_without_version(filename_ext[0])
 
         self.path = os.path.join(dirname, filename + '_v' + str(version) + '.' + filename_ext[1])
+        self.url = clean_url(os.path.join(os.path.dirname(self.url),
+                                          filename + '_v' + str(version)))
 
         if not os.path.exists(folder):
             os.makedirs(folder)
+        lines = [u'%s: %s\n' % (key, value) for key, value in self._meta.items()]
+        lines.append(u'\n')
+        lines.append(self.body.replace(u'\r\n', u'\n'))
+        content = u''.join(lines)
         with open(self.path, 'w', encoding='utf-8') as f:
-            for key, value in self._meta.items():
-                line = u'%s: %s\n' % (key, value)
-                f.write(line)
-            f.write(u'\n')
-            f.write(self.body.replace(u'\r\n', u'\n'))
+            f.write(content)
         if update:
-            self.load()
+            # render what was just written instead of reading the file back
+            self.content = content
             self.render()
+        return self
 
     @property
     def meta(self):
@@ -439,7 +711,12 @@ class Page(object):
 
     @property
     def html(self):
-        return self._html
+        if self._lazy:
+            self.load()
+            self.render()
+        if self._html is None:
+            return None
+        return postprocess(self._html)
 
     def __html__(self):
         return self.html
@@ -466,14 +743,174 @@ class Page(object):
     def tags(self, value):
         self['tags'] = value
 
+    @property
+    def tag_list(self):
+        """
+            The tags of the page as a tuple of stripped names. The
+            comma separated value is only parsed again when it changed.
+        """
+        tags = self.tags
+        if self._tag_list is None or self._tag_list[0] != tags:
+            names = tuple(tag.strip() for tag in tags.split(','))
+            self._tag_list = (tags, tuple(name for name in names if name))
+        return self._tag_list[1]
+
 
 class Wiki(object):
+    #: number of pages kept in the page cache
+    page_cache_size = 1024
+
+    # pages built by index() keyed on their path, shared by every wiki of the
+    # process and evicted least recently used first. An entry is only used
+    # while the file's modification time and size are unchanged
+    _page_cache = OrderedDict()
+    _page_cache_lock = Lock()
+
+    # index databases whose tables were created by this process keyed on
+    # their path, with whether full text search is available in them. The
+    # wiki is created per request, the schema is only set up once
+    _index_schemas = {}
+    _index_schemas_lock = Lock()
+
     def __init__(self, root):
         self.root = root
+        self._index_db = None
+        self._searchable = False
+        self._by_path = None
+        self._by_base = None
+        self._versions = None
+        self._stamps = None
+
+    @property
+    def index_db(self):
+        """
+            Database in the content directory caching the metadata of
+            the pages, so the index does not have to render every page.
+            None if the database cannot be opened, e.g. because the
+            content directory is read-only.
+        """
+        if self._index_db is None:
+            db = create_db_instance(INDEX_DATABASE, self.root)
+            if db.conn is None:
+                return None
+            with self._index_schemas_lock:
+                searchable = self._index_schemas.get(db.path)
+                if searchable is None:
+                    db.create_tables(page_index_table, page_index_root_index,
+                                     page_index_tag_table, page_index_tag_index)
+                    try:
+                        db.create_tables(page_search_table, *page_search_triggers)
+                        searchable = True
+                    except Error:
+                        # sqlite built without FTS5 or older than the
+                        # trigram tokenizer, search scans the pages instead
+                        searchable = False
+                    self._index_schemas[db.path] = searchable
+            self._searchable = searchable
+            self._index_db = db
+        return self._index_db
+
+    def close_index_db(self):
+        """
+            Closes the index database of the content directory, which is
+            shared by every wiki of the process, e.g. before the directory
+            is removed.
+        """
+        with self._index_schemas_lock:
+            self._index_schemas.pop(
+                Database.get_path(INDEX_DATABASE, self.root), None)
+        Database.close_shared_connection(INDEX_DATABASE, self.root)
+        self._index_db = None
+        self._searchable = False
 
     def path(self, url):
         return os.path.join(self.root, url + '.md')
 
+    @property
+    def by_path(self):
+        """
+            The pages of the last index keyed on their path, the index
+            is built if there is none yet.
+        """
+        if self._by_path is None:
+            self.index()
+        return self._by_path
+
+    @property
+    def stamps(self):
+        """
+            The modification time and size of the files of the last
+            index keyed on their path, as they were when the index was
+            built. The index is built if there is none yet.
+        """
+        if self._stamps is None:
+            self.index()
+        return self._stamps
+
+    @property
+    def by_base(self):
+        """
+            The highest version page of every file in the last index,
+            keyed on :meth:`Page.get_version_key`. The index is built if
+            there is none yet.
+        """
+        if self._by_base is None:
+            self.index()
+        return self._by_base
+
+    def get_versions(self, path):
+        """
+            Gets every version of a file from the last index, the index
+            is built if there is none yet.
+
+            :param str path: the path of any version of the file
+
+            :returns: the versioned pages of the file in index order
+            :rtype: list
+        """
+        return list(self.iter_versions(path))
+
+    def iter_versions(self, path):
+        """
+            Iterates over every version of a file from the last index
+            like :meth:`get_versions`, without copying them.
+
+            :param str path: the path of any version of the file
+        """
+        if self._versions is None:
+            self.index()
+        return iter(self._versions.get(Page.get_version_key(path)[0], ()))
+
+    def filter_old_versions(self, pages):
+        """
+            Keeps the pages that are the highest version of their file
+            in the last index, like :meth:`Page.filter_old_versions`
+            but without listing any directory.
+
+            :param list pages: pages of the last index
+
+            :returns: the pages in their original order
+            :rtype: list
+        """
+        by_base = self.by_base
+        pages_to_return = []
+        seen = set()
+        for page in pages:
+            highest = by_base.get(Page.get_version_key(page.path)[0])
+            if highest is not None and highest.path == page.path and page.path not in seen:
+                seen.add(page.path)
+                pages_to_return.append(page)
+        return pages_to_return
+
+    def reset_index(self):
+        """
+            Forgets the lookups of the last index after pages changed.
+        """
+        self._by_path = None
+        self._by_base = None
+        self._versions = None
+        self._stamps = None
+
     # def exists(self, url):
     #    """ Queries the database to see if page exists with given url
     #    :param url: name of page
@@ -503,6 +940,26 @@ class Wiki(object):
         return None
 
 
+    def get_highest_by_base(self, name):
+        """
+            Gets the highest version of a versioned page by its name
+            without a name version suffix, only its own directory is
+            listed instead of building the index.
+
+            :param str name: the url of the page without a version,
+                e.g. 'home' for 'home_v2'
+
+            :returns: the page, None if there is no version of it
+            :rtype: Page
+        """
+        unversioned = self.path(name)
+        path = Page.get_highest_version_of_file_path(unversioned)
+        if path == unversioned:
+            return None
+        url = os.path.join(os.path.dirname(name),
+                           os.path.basename(path)[:-len('.md')])
+        return self.get(clean_url(url))
+
     def get_or_404(self, url):
         page = self.get(url)
         if page:
@@ -536,14 +993,86 @@ class Wiki(object):
         if not os.path.exists(folder):
             os.makedirs(folder)
         os.rename(source, target)
+        self._uncache_page(source)
+        self.reset_index()
 
     def delete(self, url):
         path = self.path(url)
         if not self.exists(url):
             return False
         os.remove(path)
+        self._uncache_page(path)
+        self.reset_index()
         return True
 
+    def delete_many(self, urls):
+        """
+            Deletes several pages at once, their entries are dropped
+            from the index database in a single transaction.
+
+            :param urls: iterable of the urls of the pages to delete
+
+            :returns: the number of deleted pages
+            :rtype: int
+        """
+        removed = []
+        for url in urls:
+            path = os.path.abspath(self.path(url))
+            if os.path.exists(path):
+                os.remove(path)
+                self._uncache_page(path)
+                removed.append(path)
+        self.reset_index()
+        index_db = self.index_db
+        if index_db and removed:
+            index_db.update_page_index((), removed)
+        return len(removed)
+
+    @classmethod
+    def _get_cached_page(cls, path, url, stamp):
+        """
+            Gets a page from the page cache.
+
+            :param str path: the path of the page file
+            :param str url: the url of the page
+            :param tuple stamp: the modification time and size of the file
+
+            :returns: the cached page, None if there is none or the file
+                changed since it was cached
+            :rtype: Page
+        """
+        with cls._page_cache_lock:
+            entry = cls._page_cache.get(path)
+            if entry is None or entry[0] != stamp or entry[1].url != url:
+                return None
+            cls._page_cache.move_to_end(path)
+            return entry[1]
+
+    @classmethod
+    def _cache_page(cls, page, stamp):
+        """
+            Adds a page to the page cache, evicting the least recently
+            used page once the cache is full.
+
+            :param Page page: the page to cache
+            :param tuple stamp: the modification time and size of the file
+        """
+        with cls._page_cache_lock:
+            cls._page_cache[page.path] = (stamp, page)
+            cls._page_cache.move_to_end(page.path)
+            if len(cls._page_cache) > cls.page_cache_size:
+                cls._page_cache.popitem(last=False)
+
+    @classmethod
+    def _uncache_page(cls, path):
+        """
+            Removes the page with the given path from the page cache.
+
+            :param str path: the path of the page file
+        """
+        with cls._page_cache_lock:
+            cls._page_cache.pop(os.path.abspath(path), None)
+
     def index(self):
         """
             Builds up a list of all the available pages.
@@ -554,7 +1083,15 @@ class Wiki(object):
         # make sure we always have the absolute path for fixing the
         # walk path
         pages = []
+        stamps = {}
         root = os.path.abspath(self.root)
+        # pages are taken from the page cache or created from the index
+        # database, they are only rendered again when their file changed
+        index_db = self.index_db
+        cached = index_db.get_page_index(root) if index_db else {}
+        changed = []
+        changed_tags = []
+        unloaded = []
         for cur_dir, _, files in os.walk(root):
             # get the url of the current directory
             cur_dir_url = cur_dir[len(root)+1:]
@@ -562,9 +1099,46 @@ class Wiki(object):
                 path = os.path.join(cur_dir, cur_file)
                 if cur_file.endswith('.md'):
                     url = clean_url(os.path.join(cur_dir_url, cur_file[:-3]))
-                    page = Page(path, url)
+                    stat = os.stat(path)
+                    stamp = stamps[path] = (stat.st_mtime_ns, stat.st_size)
+                    page = self._get_cached_page(path, url, stamp)
+                    indexed = cached.pop(path, None) == stamp
+                    if page is None and indexed:
+                        unloaded.append((path, url, stamp))
+                        continue
+                    if page is None:
+                        page = Page(path, url)
+                        self._cache_page(page, stamp)
+                    if not indexed:
+                        changed.append((path, root) + stamp +
+                                       (page.title, page.tags,
+                                        json.dumps(list(page.meta.items())), page.body))
+                        changed_tags.extend((path, tag) for tag in page.tag_list)
                     pages.append(page)
-        return sorted(pages, key=lambda x: x.title.lower())
+        if unloaded:
+            entries = index_db.get_page_index_entries([path for path, _, _ in unloaded])
+            for path, url, stamp in unloaded:
+                entry = entries.get(path)
+                if entry is None:
+                    # removed from the index by another process meanwhile
+                    page = Page(path, url)
+                else:
+                    page = Page.from_index(path, url, json.loads(entry[0]), entry[1])
+                self._cache_page(page, stamp)
+                pages.append(page)
+        # whatever is left in cached belongs to removed pages
+        if index_db and (changed or cached):
+            index_db.update_page_index(changed, cached, changed_tags)
+        pages.sort(key=lambda x: x.title.lower())
+        self._stamps = stamps
+        self._by_path = {page.path: page for page in pages}
+        self._by_base = Page.get_highest_versions(pages)
+        self._versions = defaultdict(list)
+        for page in pages:
+            key, version = Page.get_version_key(page.path)
+            if version is not None:
+                self._versions[key].append(page)
+        return pages
 
     def index_by(self, key):
         """
@@ -579,43 +1153,58 @@ class Wiki(object):
                 a list of pages that share the given attribute.
             :rtype: dict
         """
-        pages = {}
+        pages = defaultdict(list)
         for page in self.index():
-            value = getattr(page, key)
-            pre = pages.get(value, [])
-            pages[value] = pre.append(page)
-        return pages
+            pages[getattr(page, key)].append(page)
+        return dict(pages)
 
     def get_by_title(self, title):
-        pages = self.index(attr='title')
+        pages = self.index_by('title')
         return pages.get(title)
 
     def get_tags(self):
         pages = self.index()
-        tags = {}
-        for page in pages:
-            pagetags = page.tags.split(',')
-            for tag in pagetags:
-                tag = tag.strip()
-                if tag == '':
-                    continue
-                elif tags.get(tag):
+        index_db = self.index_db
+        if index_db is None:
+            tags = defaultdict(list)
+            for page in pages:
+                for tag in page.tag_list:
                     tags[tag].append(page)
-                else:
-                    tags[tag] = [page]
-        return tags
+            return dict(tags)
+
+        # the tags are grouped by the index database, the pages of every
+        # tag keep the order of the index
+        order = {page.path: position for position, page in enumerate(pages)}
+        tags = defaultdict(list)
+        for tag, path in index_db.get_page_index_tags(os.path.abspath(self.root)):
+            if path in order:
+                tags[tag].append(order[path])
+        return {tag: [pages[position] for position in sorted(positions)]
+                for tag, positions in tags.items()}
 
     def index_by_tag(self, tag):
         pages = self.index()
-        tagged = []
-        for page in pages:
-            if tag in page.tags:
-                tagged.append(page)
-        return sorted(tagged, key=lambda x: x.title.lower())
+        index_db = self.index_db
+        # pages are matched on whole tags, 'cat' does not match 'category'
+        if index_db is None:
+            return [page for page in pages if tag in page.tag_list]
+        tagged = index_db.get_tagged_page_index(os.path.abspath(self.root), tag)
+        return [page for page in pages if page.path in tagged]
 
     def search(self, term, ignore_case=True, attrs=['title', 'tags', 'body']):
         pages = self.index()
-        regex = re.compile(term, re.IGNORECASE if ignore_case else 0)
+        regex = _compile_search(term, ignore_case)
+        # a plain text term is looked up in the full text index first,
+        # which finds every page the regex can match and maybe a few
+        # more, so only those are scanned. The index only holds the
+        # title, tags and body of the pages
+        if (self._searchable and not _REGEX_SPECIAL_RE.search(term) and
+                set(attrs) <= _SEARCH_INDEX_ATTRS):
+            fragments = _search_index_fragments(term, ignore_case)
+            if fragments:
+                found = self.index_db.search_page_index(
+                    os.path.abspath(self.root), *fragments)
+                pages = [page for page in pages if page.path in found]
         matched = []
         for page in pages:
             for attr in attrs:
@@ -2,19 +2,30 @@
     Routes
     ~~~~~~
 """
+from collections import defaultdict
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import os
+from threading import Lock
+
 from flask import Blueprint
 from flask import flash
+from flask import g
+from flask import make_response
 from flask import redirect
 from flask import render_template
 from flask import request
+from flask import session
 from flask import url_for
 from flask_login import current_user
 from flask_login import login_required
 from flask_login import login_user
 from flask_login import logout_user
-from user import UserManager
 
-from wiki.core import Processor
+from wiki.core import postprocess
+from wiki.core import render
+from wiki.core import render_markdown
 from wiki.web.forms import EditorForm
 from wiki.web.forms import LoginForm
 from wiki.web.forms import SearchForm
@@ -29,12 +40,172 @@ from wiki.core import Page
 
 bp = Blueprint('wiki', __name__)
 
+#: number of rendered views kept in memory
+VIEW_CACHE_SIZE = 256
+
+# rendered views keyed on request url, etag and epoch, so unchanged views
+# are not rendered again. Evicted least recently used first
+_view_cache = OrderedDict()
+_view_cache_lock = Lock()
+
+# bumped whenever pages are changed through the wiki, which invalidates every
+# cached view at once. The stale entries are evicted like any other
+_view_epoch = 0
+
+#: environment variable enabling the preview worker processes. Its value is
+#: the number of processes, 0 starts one per cpu. Unset, previews are
+#: rendered in the request thread
+PREVIEW_WORKERS_ENV = 'WIKI_PREVIEW_WORKERS'
+
+_preview_executor = None
+_preview_executor_lock = Lock()
+
+
+def _index():
+    """
+        Returns the index of the current wiki, built at most once per
+        request.
+    """
+    pages = getattr(g, '_wiki_index', None)
+    if pages is None:
+        pages = g._wiki_index = current_wiki.index()
+    return pages
+
+
+def _reset_index():
+    """
+        Drops the index of the current request and the cached views after
+        pages were changed.
+    """
+    global _view_epoch
+    g.pop('_wiki_index', None)
+    current_wiki.reset_index()
+    with _view_cache_lock:
+        _view_epoch += 1
+
+
+def _etag(*paths):
+    """
+        Builds an etag for a view from the modification time and size of
+        the files it shows, the wiki and the user looking at them.
+
+        :returns: the etag, None if one of the files does not exist
+    """
+    stamps = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        stamps.append((path, (stat.st_mtime_ns, stat.st_size)))
+    return _etag_from_stamps(stamps)
+
+
+def _index_etag(pages):
+    """
+        Builds an etag for a view listing pages of the index, from the
+        modification times and sizes the index took of their files.
+    """
+    stamps = current_wiki.stamps
+    return _etag_from_stamps((page.path, stamps[page.path]) for page in pages)
+
+
+def _etag_from_stamps(stamps):
+    """
+        Builds an etag from the wiki, the user looking at it and the
+        (path, (mtime, size)) pairs of the files a view shows.
+    """
+    parts = [os.path.abspath(current_wiki.root), current_user.get_id() or u'']
+    parts.extend(u'%s:%d:%d' % (path, mtime, size)
+                 for path, (mtime, size) in stamps)
+    return hashlib.md5(u'\n'.join(parts).encode('utf-8')).hexdigest()
+
+
+def _get_preview_executor():
+    """
+        Returns the process pool previews are rendered in, started on the
+        first preview.
+
+        :returns: the executor, None if preview workers are not enabled
+    """
+    global _preview_executor
+    workers = os.environ.get(PREVIEW_WORKERS_ENV)
+    if not workers:
+        return None
+    with _preview_executor_lock:
+        if _preview_executor is None:
+            _preview_executor = ProcessPoolExecutor(
+                max_workers=int(workers) or os.cpu_count())
+    return _preview_executor
+
+
+def _cached_view(key, view):
+    """
+        Renders a view or takes it from the view cache.
+
+        :param key: the cache key, request url, etag and epoch of the
+            view
+        :param view: function rendering the view
+    """
+    with _view_cache_lock:
+        html = _view_cache.get(key)
+        if html is not None:
+            _view_cache.move_to_end(key)
+            return html
+    html = view()
+    if isinstance(html, str):
+        with _view_cache_lock:
+            _view_cache[key] = html
+            if len(_view_cache) > VIEW_CACHE_SIZE:
+                _view_cache.popitem(last=False)
+    return html
+
+
+def _last_modified(path):
+    """
+        Returns the modification time of a file, None if it does not
+        exist.
+    """
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+def _conditional(etag, view, last_modified=None):
+    """
+        Answers with 304 Not Modified if the client already has the
+        version of the view with the given etag, otherwise renders it
+        or takes it from the view cache. Browsers have to revalidate the
+        view on every request.
+
+        :param etag: the etag of the view, None to always render it
+        :param view: function rendering the view
+        :param last_modified: modification time of the file the view
+            shows, answers If-Modified-Since requests as well
+    """
+    # flashed messages are part of the page but not of the etag
+    if etag is None or session.get('_flashes'):
+        return view()
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+        response.set_etag(etag)
+    else:
+        response = make_response(_cached_view(
+            (request.url, etag, _view_epoch), view))
+        response.set_etag(etag)
+        response.last_modified = last_modified
+        # the cached html is answered like a static file, with
+        # If-Modified-Since and range requests
+        response.make_conditional(request, accept_ranges=True)
+    response.cache_control.no_cache = True
+    return response
+
+
 @bp.route('/')
 @protect
 def home():
-    pages = current_wiki.index()
-    page = Page.get_highest_page_from_unversioned_file(pages, 'home')
-    # page = current_wiki.get('home')
+    page = current_wiki.get_highest_by_base('home')
     if page:
         return display(page.url)
     return render_template('home.html')
@@ -42,16 +213,20 @@ def home():
 @bp.route('/index/')
 @protect
 def index():
-    pages = current_wiki.index()
-    pages = Page.filter_old_versions(pages)
-    return render_template('index.html', pages=pages)
+    pages = _index()
+    return _conditional(
+        _index_etag(pages),
+        lambda: render_template('index.html', pages=current_wiki.filter_old_versions(pages)))
 
 
 @bp.route('/<path:url>/')
 @protect
 def display(url):
-    page = current_wiki.get_or_404(url)
-    return render_template('page.html', page=page)
+    path = current_wiki.path(url)
+    return _conditional(
+        _etag(path),
+        lambda: render_template('page.html', page=current_wiki.get_or_404(url)),
+        _last_modified(path))
 
 @bp.route('/display_version/<path:url>/')
 @protect
@@ -62,8 +237,11 @@ def display_version(url):
     @date: 04/08/2018
     Similar to display but with only conditions applying to a previous version
     """
-    page = current_wiki.get_or_404(url)
-    return render_template('versioned_page.html', page=page)
+    path = current_wiki.path(url)
+    return _conditional(
+        _etag(path),
+        lambda: render_template('versioned_page.html', page=current_wiki.get_or_404(url)),
+        _last_modified(path))
 
 @bp.route('/recover/<path:url>/')
 @protect
@@ -80,6 +258,7 @@ def recover(url):
         page = current_wiki.get_bare(url)
     form.populate_obj(page)
     page.save()
+    _reset_index()
     flash('"%s" was saved.' % page.title, 'success')
     return redirect(url_for('wiki.display', url=url))
 
@@ -103,20 +282,10 @@ def edit(url):
         if not page:
             page = current_wiki.get_bare(url)
         form.populate_obj(page)
-        page.save()
-        new_path = Page.get_highest_version_of_file_path(page.path)
-        pages = current_wiki.index()
-        new_page = None
-
-        for p in pages:
-            if p.path == new_path:
-                new_page = p
-
-        if new_page is None:
-            new_page = page
-
-        flash('"%s" was saved.' % new_page.title, 'success')
-        return redirect(url_for('wiki.display', url=new_page.url))
+        saved = page.save()
+        _reset_index()
+        flash('"%s" was saved.' % saved.title, 'success')
+        return redirect(url_for('wiki.display', url=saved.url))
     return render_template('editor.html', form=form, page=page)
 
 
@@ -130,19 +299,26 @@ def versions(url):
     Returns all page versions of a specified url
     'myfile_v1' -> [Page with 'path/to/myfile_v1.txt', Page with 'path/to/myfile_v2.txt']
     """
-    page = current_wiki.get(url)
-    all_pages = current_wiki.index()
-    pages = Page.get_versions(page.path, all_pages)
-    return render_template('versions.html', pages=pages)
+    page = current_wiki.get_or_404(url)
+    # the etag is built from the version files in the page's directory,
+    # the index is only needed to render the view
+    return _conditional(
+        _etag(*Page.get_version_paths(page.path)),
+        lambda: render_template('versions.html',
+                                pages=current_wiki.get_versions(page.path)))
 
 
 @bp.route('/preview/', methods=['POST'])
 @protect
 def preview():
-    data = {}
-    processor = Processor(request.form['body'])
-    data['html'], data['body'], data['meta'] = processor.process()
-    return data['html']
+    # previews are sent on every edit, unchanged text is rendered once
+    executor = _get_preview_executor()
+    if executor is None:
+        return render(request.form['body'])
+    # wikilinks need the request to build their urls, so they are only
+    # resolved once the worker returns the html
+    html = executor.submit(render_markdown, request.form['body']).result()
+    return postprocess(html)
 
 
 @bp.route('/move/<path:url>/', methods=['GET', 'POST'])
@@ -153,13 +329,11 @@ def move(url):
     if form.validate_on_submit():
         newurl = form.url.data
         current_wiki.move(url, newurl)
+        _reset_index()
 
         # Delete non-moved pages
-        all_pages = current_wiki.index()
-        pages = Page.get_versions(page.path, all_pages)
-
-        for p in pages:
-            current_wiki.delete(p.url)
+        current_wiki.delete_many(
+            p.url for p in current_wiki.iter_versions(page.path))
 
         flash('Page "%s" was deleted.' % page.title, 'success')
 
@@ -172,11 +346,9 @@ def move(url):
 @protect
 def delete(url):
     page = current_wiki.get_or_404(url)
-    all_pages = current_wiki.index()
-    pages = Page.get_versions(page.path, all_pages)
-
-    for p in pages:
-        current_wiki.delete(p.url)
+    current_wiki.delete_many(
+        p.url for p in current_wiki.iter_versions(page.path))
+    _reset_index()
 
     flash('Page "%s" was deleted.' % page.title, 'success')
     return redirect(url_for('wiki.home'))
@@ -185,31 +357,43 @@ def delete(url):
 @bp.route('/tags/')
 @protect
 def tags():
-    ts = current_wiki.get_tags()
-    new_tags = {}
-    for t in ts:
-        if t not in new_tags:
-            new_tags[t] = []
-        for p in ts[t]:
-            page = Page.get_highest_version_of_file_path(p.path)
-            if page not in new_tags[t]:
-                new_tags[t].append(page)
+    pages = _index()
 
-    return render_template('tags.html', tags=new_tags)
+    def view():
+        # every tagged page counts once for the latest version of its file
+        highest = current_wiki.by_base
+        new_tags = defaultdict(set)
+        for t, tagged in current_wiki.get_tags().items():
+            for p in tagged:
+                new_tags[t].add(
+                    highest.get(Page.get_version_key(p.path)[0], p))
+        new_tags = {t: sorted(v, key=lambda p: p.title.lower())
+                    for t, v in new_tags.items()}
+        return render_template('tags.html', tags=new_tags)
+
+    return _conditional(_index_etag(pages), view)
 
 
 @bp.route('/tag/<string:name>/')
 @protect
 def tag(name):
-    tagged = current_wiki.index_by_tag(name)
-    new_pages = []
+    pages = _index()
+
+    def view():
+        tagged = current_wiki.index_by_tag(name)
+        highest = current_wiki.by_base
+        new_pages = []
+        seen = set()
 
-    for t in tagged:
-        p = Page.get_highest_version_of_file_path(t.path)
-        if t.path == p and t not in new_pages:
-            new_pages.append(t)
+        # only the latest version of every tagged file is listed
+        for t in tagged:
+            p = highest.get(Page.get_version_key(t.path)[0], t)
+            if t.path == p.path and t.path not in seen:
+                seen.add(t.path)
+                new_pages.append(t)
+        return render_template('tag.html', pages=new_pages, tag=name)
 
-    return render_template('tag.html', pages=new_pages, tag=name)
+    return _conditional(_index_etag(pages), view)
 
 
 @bp.route('/search/', methods=['GET', 'POST'])
@@ -218,7 +402,7 @@ def search():
     form = SearchForm()
     if form.validate_on_submit():
         results = current_wiki.search(form.term.data, form.ignore_case.data)
-        results = Page.filter_old_versions(results)
+        results = current_wiki.filter_old_versions(results)
         return render_template('search.html', form=form,
                                results=results, search=form.term.data)
     return render_template('search.html', form=form, search=None)
@@ -253,11 +437,13 @@ def user_logout():
 @bp.route('/user/create/', methods=['GET', 'POST'])
 def user_create():
     form = CreateUserForm()
-    manager = UserManager('user')
     if form.validate_on_submit():
         localtime = str(datetime.now())
-        manager.add_user(form.name.data, form.password.data, localtime, True, [], None)
-        user = current_users.get_user(form.name.data)
+        user = current_users.add_user(form.name.data, form.password.data,
+                                      localtime, True, [], None)
+        if not user:
+            flash('User "%s" already exists.' % form.name.data, 'danger')
+            return render_template('createuser.html', form=form)
         login_user(user)
         user.set('authenticated', True)
         flash('User successfully created', 'success')
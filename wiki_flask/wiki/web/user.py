@@ -7,6 +7,7 @@ import json
 import binascii
 import hashlib
 from functools import wraps
+from threading import Lock
 
 from flask import current_app
 from flask_login import current_user
@@ -15,22 +16,44 @@ from flask_login import current_user
 
 class UserManager(object):
     """A very simple user Manager, that saves it's data as json."""
+    # parsed user files keyed on their path, together with the
+    # (mtime, size) stamp they were read at. Shared between managers so
+    # every request does not parse the file again. The cached dicts are
+    # never changed, the methods changing users copy them first and the
+    # cache is only replaced once a write succeeded.
+    _cache = {}
+    _cache_lock = Lock()
+
     def __init__(self, path):
         self.file = os.path.join(path, 'users.json')
 
+    def _stamp(self):
+        stat = os.stat(self.file)
+        return (stat.st_mtime_ns, stat.st_size)
+
     def read(self):
-        if not os.path.exists(self.file):
-            return {}
-        with open(self.file) as f:
-            data = json.loads(f.read())
-        return data
+        """Returns the users, the dict is shared and must not be changed."""
+        with self._cache_lock:
+            try:
+                stamp = self._stamp()
+            except OSError:
+                return {}
+            cached = self._cache.get(self.file)
+            if cached is None or cached[0] != stamp:
+                with open(self.file) as f:
+                    cached = self._cache[self.file] = (stamp, json.loads(f.read()))
+        return cached[1]
 
     def write(self, data):
-        with open(self.file, 'w') as f:
-            f.write(json.dumps(data, indent=2))
+        content = json.dumps(data, indent=2)
+        with self._cache_lock:
+            with open(self.file, 'w') as f:
+                f.write(content)
+            # parsed again, the caller may go on changing data
+            self._cache[self.file] = (self._stamp(), json.loads(content))
 
     def add_user(self, name, password, time, active=True, roles=[], authentication_method=None):
-        users = self.read()
+        users = dict(self.read())
 
         if users.get(name):
             return False
@@ -63,7 +86,7 @@ class UserManager(object):
         userarray = []
 
         for i in users:
-            user = User(self,i,users.get(i))
+            user = User(self,i,dict(users.get(i)))
             user.time = users.get(i).get("time")
             userarray.append(user)
 
@@ -74,17 +97,17 @@ class UserManager(object):
         userdata = users.get(name)
         if not userdata:
             return None
-        return User(self, name, userdata)
+        return User(self, name, dict(userdata))
 
     def delete_user(self, name):
-        users = self.read()
+        users = dict(self.read())
         if not users.pop(name, False):
             return False
         self.write(users)
         return True
 
     def update(self, name, userdata):
-        data = self.read()
+        data = dict(self.read())
         data[name] = userdata
         self.write(data)
 